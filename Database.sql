@@ -190,3 +190,5 @@ WHERE o.created_at >= NOW() - INTERVAL '30 days';
 
 
 
+
+-- Later schema changes are versioned in migrations/ and applied with: python migrate.py
@@ -3,6 +3,9 @@ from flask import Flask, request
 from flask_cors import CORS
 from dotenv import load_dotenv
 
+import db
+import query_metrics
+
 # Import blueprints
 from product_api import product_bp
 from product_detail_api import product_detail_bp
@@ -18,6 +21,7 @@ from routes.admin.dashboard import admin_dashboard_bp
 from routes.admin.inventory_management import admin_inventory_bp
 from routes.admin.order_management import admin_orders_bp
 from routes.admin.product_management import admin_products_bp
+from routes.admin.query_stats import admin_query_stats_bp
 from routes.address_routes import address_bp
 from checkout_routes import checkout_bp
 
@@ -26,6 +30,11 @@ load_dotenv()
 
 app = Flask(__name__)
 
+# One pooled DB connection per request, released in teardown
+db.init_app(app)
+# Server-Timing header and N+1 warnings for DB queries
+query_metrics.init_app(app)
+
 CORS(
     app,
     resources={
@@ -83,6 +92,7 @@ app.register_blueprint(admin_dashboard_bp)
 app.register_blueprint(admin_inventory_bp)
 app.register_blueprint(admin_orders_bp)
 app.register_blueprint(admin_products_bp)
+app.register_blueprint(admin_query_stats_bp)
 
 # Extra route
 app.add_url_rule('/myip', view_func=my_ip)
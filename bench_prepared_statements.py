@@ -0,0 +1,101 @@
+"""
+Compare parse/plan cost of the hot queries with and without prepared statements.
+
+Runs every statement registered in prepared_statements.py against the
+configured database (same DB_* environment as the app), once as plain SQL
+and once through PREPARE/EXECUTE, and reports:
+  - server-side planning time from EXPLAIN (ANALYZE) for both forms
+  - client-observed mean latency over N iterations for both forms
+
+Run with: python bench_prepared_statements.py [iterations]
+"""
+import sys
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+import db
+import prepared_statements
+# Importing the blueprints registers their statements
+import cart_routes  # noqa: F401
+import checkout_routes  # noqa: F401
+import product_detail_api  # noqa: F401
+
+load_dotenv()
+
+# Query that yields a realistic parameter tuple for each statement
+SAMPLE_PARAMS = {
+    'cart_items_for_user': "SELECT c.user_id FROM cart c JOIN cart_items ci ON ci.cart_id = c.id LIMIT 1",
+    'checkout_cart_items': "SELECT c.user_id FROM cart c JOIN cart_items ci ON ci.cart_id = c.id LIMIT 1",
+    'product_detail_by_id': "SELECT product_id FROM product_reviews GROUP BY product_id ORDER BY COUNT(*) DESC LIMIT 1",
+    'product_detail_by_code': """
+        SELECT p.product_code FROM product_reviews r JOIN products p ON p.id = r.product_id
+        GROUP BY p.product_code ORDER BY COUNT(*) DESC LIMIT 1
+    """,
+}
+
+
+def planning_time(cur, sql, params):
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+    return cur.fetchone()[0][0]['Planning Time']
+
+
+def mean_latency_ms(cur, sql, params, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        cur.execute(sql, params)
+        cur.fetchall()
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+def bench_statement(conn, name, sql, iterations):
+    cur = conn.cursor()
+    sample_query = SAMPLE_PARAMS.get(name)
+    if not sample_query:
+        print(f"{name}: no sample parameters defined, skipped")
+        return
+    cur.execute(sample_query)
+    row = cur.fetchone()
+    if not row:
+        print(f"{name}: no sample data, skipped")
+        return
+    params = tuple(row)
+
+    positional_sql, count = prepared_statements.to_positional(sql)
+    execute_sql = f"EXECUTE {name} ({', '.join(['%s'] * count)})"
+    cur.execute("DEALLOCATE ALL")
+    cur.execute(f"PREPARE {name} AS {positional_sql}")
+
+    plain_plan = planning_time(cur, sql, params)
+    # Postgres switches to a cached generic plan after five custom-plan executions
+    for _ in range(6):
+        cur.execute(execute_sql, params)
+    prepared_plan = planning_time(cur, execute_sql, params)
+
+    plain_ms = mean_latency_ms(cur, sql, params, iterations)
+    prepared_ms = mean_latency_ms(cur, execute_sql, params, iterations)
+    conn.rollback()
+    cur.close()
+
+    print(f"{name}")
+    print(f"  planning time   plain {plain_plan:8.3f} ms   prepared {prepared_plan:8.3f} ms")
+    print(f"  mean latency    plain {plain_ms:8.3f} ms   prepared {prepared_ms:8.3f} ms"
+          f"   ({(1 - prepared_ms / plain_ms) * 100 if plain_ms else 0:+.1f}% saved)")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    # A dedicated connection, so the pool's per-session registry isn't disturbed
+    conn = psycopg2.connect(**db.direct_connection_kwargs())
+    try:
+        print(f"Benchmarking {len(prepared_statements.registered())} statements, {iterations} iterations each")
+        print("=" * 70)
+        for name, sql in sorted(prepared_statements.registered().items()):
+            bench_statement(conn, name, sql, iterations)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
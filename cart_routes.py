@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, session
 import os
-import psycopg2
+from db import get_connection, CART, DB_TIMEOUT_ERRORS, timeout_response
+import prepared_statements
 from dotenv import load_dotenv
 import uuid
 
@@ -8,15 +9,22 @@ load_dotenv()
 
 cart_bp = Blueprint('cart', __name__)
 
+# Column order matters: get_cart reads the rows positionally
+CART_ITEMS_STMT = prepared_statements.register('cart_items_for_user', """
+    SELECT ci.id AS cart_item_id,
+           p.id AS product_id,
+           p.name AS product_name,
+           p.product_code,
+           ci.quantity,
+           COALESCE(p.price, 0) AS price
+    FROM cart c
+    JOIN cart_items ci ON c.id = ci.cart_id
+    JOIN products p ON ci.product_id = p.id
+    WHERE c.user_id = %s
+""")
+
 def get_db_connection():
-    conn = psycopg2.connect(
-        host=os.environ.get('DB_HOST'),
-        database=os.environ.get('DB_NAME'),
-        user=os.environ.get('DB_USER'),
-        password=os.environ.get('DB_PASSWORD'),
-        port=os.environ.get('DB_PORT', 5432),
-        sslmode=os.getenv('DB_SSLMODE', 'require')  # allow override locally
-    )
+    conn = get_connection(route_class=CART)
     cur = conn.cursor()
     return conn, cur
 
@@ -93,6 +101,9 @@ def add_to_cart():
             'user_type': 'guest' if not request.headers.get('Authorization') else 'authenticated'
         }), 201
 
+    except DB_TIMEOUT_ERRORS as e:
+        conn.rollback()
+        return timeout_response(e)
     except Exception as e:
         conn.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -142,6 +153,9 @@ def update_cart_item():
         conn.commit()
         return jsonify({'success': True, 'message': 'Cart updated'}), 200
 
+    except DB_TIMEOUT_ERRORS as e:
+        conn.rollback()
+        return timeout_response(e)
     except Exception as e:
         conn.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -160,18 +174,7 @@ def get_cart():
         return jsonify({'success': False, 'message': 'Database connection failed'}), 500
     try:
         # Fetch cart items with product info - ensure column order matches usage
-        cur.execute("""
-            SELECT ci.id AS cart_item_id,
-                   p.id AS product_id,
-                   p.name AS product_name,
-                   p.product_code,
-                   ci.quantity,
-                   COALESCE(p.price, 0) AS price
-            FROM cart c
-            JOIN cart_items ci ON c.id = ci.cart_id
-            JOIN products p ON ci.product_id = p.id
-            WHERE c.user_id = %s
-        """, (user_id,))
+        prepared_statements.execute(cur, CART_ITEMS_STMT, (user_id,))
         items = cur.fetchall()
         
         # Format response properly - match column order
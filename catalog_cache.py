@@ -0,0 +1,210 @@
+"""
+In-process cache for catalog responses.
+
+GET /products serves its serialized listing from here instead of reading the
+product_listing view (product_listing.py) on every hit. Entries expire after
+CATALOG_CACHE_TTL seconds (default 60) and are tagged with the tables they
+were built from; code that writes one of those tables calls invalidate()
+after committing, which drops every entry carrying the tag.
+
+Each worker process keeps its own cache. Writes handled by other workers (or
+made directly in the database) reach it through catalog_listener.py, which
+LISTENs for the notifications sent by the triggers in
+migrations/0002_catalog_change_notify.sql; while that listener is connected
+the TTL is only a backstop and can safely be long.
+
+With a read replica configured (DB_REPLICA_DSN), a listing rebuilt right after
+a write may still come from a replica that hasn't replayed it. For
+DB_REPLICA_MAX_LAG seconds after each invalidation nothing new is stored.
+
+A reader that started before an invalidation may finish after it. Such a
+reader passes the generation() it saw to set(), and its now-stale result is
+not stored.
+
+Cached responses are CachedBody objects: the JSON bytes exactly as sent, a
+gzip copy (CATALOG_GZIP, default true, for bodies over 1 KB) and a strong
+ETag derived from the content. A hit is answered without touching the
+database or the serializer, and a matching If-None-Match with a bare 304.
+"""
+import os
+import gzip
+import time
+import hashlib
+import logging
+import threading
+
+from flask import current_app, request
+
+# Tags: the tables a cached entry was built from
+PRODUCTS = 'products'
+INVENTORY = 'inventory'
+PRODUCT_LISTING = 'product_listing'
+
+
+def _ttl():
+    try:
+        return float(os.environ.get('CATALOG_CACHE_TTL', 60))
+    except (TypeError, ValueError):
+        return 60.0
+
+
+def _replica_hold():
+    """Seconds a replica may trail the primary, or 0 without a replica."""
+    if not os.environ.get('DB_REPLICA_DSN'):
+        return 0.0
+    try:
+        return float(os.environ.get('DB_REPLICA_MAX_LAG', 5))
+    except (TypeError, ValueError):
+        return 5.0
+
+
+def _gzip_enabled():
+    return os.environ.get('CATALOG_GZIP', 'true').strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+class CachedBody:
+    """A ready-to-send JSON response body with its ETag and optional gzip copy."""
+
+    GZIP_MIN_SIZE = 1024
+
+    def __init__(self, body, mimetype='application/json'):
+        self.body = body
+        self.mimetype = mimetype
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.gzipped = None
+        if _gzip_enabled() and len(body) >= self.GZIP_MIN_SIZE:
+            self.gzipped = gzip.compress(body, compresslevel=6, mtime=0)
+            # Each encoding is a distinct representation and needs its own strong tag
+            self.gzip_etag = f'"{digest}-gzip"'
+
+    def _not_modified(self):
+        header = request.headers.get('If-None-Match')
+        if not header:
+            return False
+        tags = {t.strip().removeprefix('W/') for t in header.split(',')}
+        return '*' in tags or self.etag in tags or (self.gzipped is not None and self.gzip_etag in tags)
+
+    def response(self):
+        """Response for the current request: 304, gzip or identity."""
+        use_gzip = self.gzipped is not None and request.accept_encodings['gzip'] > 0
+        response = current_app.response_class(status=304 if self._not_modified() else 200)
+        if response.status_code == 200:
+            response.set_data(self.gzipped if use_gzip else self.body)
+            response.mimetype = self.mimetype
+            if use_gzip:
+                response.headers['Content-Encoding'] = 'gzip'
+        response.headers['ETag'] = self.gzip_etag if use_gzip else self.etag
+        response.headers['Cache-Control'] = 'no-cache'
+        if self.gzipped is not None:
+            response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+
+class TTLCache:
+    """Thread-safe key/value cache with per-entry expiry and tag-based invalidation."""
+
+    def __init__(self, ttl=60.0, maxsize=256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = {}  # key -> (expires_at, value, tags)
+        self._generation = 0
+        self._hold_until = 0.0
+        self._lock = threading.Lock()
+
+    def generation(self):
+        """Counter bumped by every invalidation; pass it to set()."""
+        return self._generation
+
+    def get(self, key):
+        """Return the cached value for `key`, or None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            return None
+        return entry[1]
+
+    def set(self, key, value, tags=(), generation=None):
+        """
+        Store `value` under `key`. Returns False, storing nothing, when the
+        cache was invalidated after `generation` was taken or is still inside
+        an invalidation's hold period.
+        """
+        if self.ttl <= 0:
+            return False
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            if time.monotonic() < self._hold_until:
+                return False
+            if key not in self._entries and len(self._entries) >= self.maxsize:
+                # Make room: expired entries first, then the one closest to expiry
+                now = time.monotonic()
+                for stale in [k for k, e in self._entries.items() if e[0] <= now]:
+                    del self._entries[stale]
+                if len(self._entries) >= self.maxsize:
+                    del self._entries[min(self._entries, key=lambda k: self._entries[k][0])]
+            self._entries[key] = (time.monotonic() + self.ttl, value, frozenset(tags))
+        return True
+
+    def invalidate(self, *tags, hold=0.0):
+        """
+        Drop every entry tagged with any of `tags` (all entries if none given),
+        and refuse new entries for the next `hold` seconds.
+        """
+        with self._lock:
+            self._generation += 1
+            if hold > 0:
+                self._hold_until = max(self._hold_until, time.monotonic() + hold)
+            if not tags:
+                dropped = len(self._entries)
+                self._entries.clear()
+                return dropped
+            wanted = set(tags)
+            keys = [k for k, e in self._entries.items() if e[2] & wanted]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def hold_until(self):
+        """time.monotonic() at which the current hold ends, or None when there is none."""
+        hold_until = self._hold_until
+        return hold_until if time.monotonic() < hold_until else None
+
+    def __len__(self):
+        return len(self._entries)
+
+
+catalog_cache = TTLCache(ttl=_ttl())
+
+# (tags, callback) pairs run by invalidate(); see on_invalidate()
+_subscribers = []
+
+
+def on_invalidate(callback, *tags):
+    """
+    Call `callback()` after every invalidation of any of `tags` (of anything
+    when no tags are given), for worker-local data derived from the catalog
+    that doesn't live in the cache itself.
+    """
+    _subscribers.append((frozenset(tags), callback))
+    return callback
+
+
+def invalidate(*tags, hold=None):
+    """
+    Evict catalog entries built from any of `tags`. Call after the write
+    commits. `hold` overrides the replica hold (DB_REPLICA_MAX_LAG).
+    """
+    dropped = catalog_cache.invalidate(*tags, hold=_replica_hold() if hold is None else hold)
+    for subscribed, callback in list(_subscribers):
+        if not tags or not subscribed or subscribed.intersection(tags):
+            try:
+                callback()
+            except Exception as e:
+                logging.warning(f"Catalog invalidation callback {callback!r} failed: {e}")
+    return dropped
@@ -0,0 +1,139 @@
+"""
+Cross-worker catalog cache invalidation over Postgres LISTEN/NOTIFY.
+
+The triggers in migrations/0002_catalog_change_notify.sql send the name of
+the changed table on the 'catalog_changes' channel whenever products or
+inventory are written, by any worker or by hand, and product_listing.py sends 'product_listing' after refreshing that view.
+start() runs a daemon thread in the calling process that LISTENs on that
+channel and evicts the matching entries from catalog_cache as each
+notification arrives.
+
+LISTEN is session state, so the listener keeps its own long-lived connection
+to Postgres itself (db.direct_connection_kwargs(), i.e. DB_DIRECT_HOST when a
+transaction pooler sits in front of DB_HOST) rather than borrowing from the
+pool. Notifications sent while it is disconnected are lost, so after every
+(re)connect the whole cache, and everything subscribed to it, is dropped.
+gunicorn.conf.py waits for the first connect (`connected`) before loading the
+worker's indexes, so they are loaded after LISTEN and are not dropped again.
+
+Configuration (environment):
+    CATALOG_LISTEN  set to false to disable the listener (default true)
+"""
+import os
+import select
+import logging
+import threading
+
+import psycopg2
+
+import db
+import catalog_cache
+
+CHANNEL = 'catalog_changes'
+
+# Payload (table name) -> cache tags to evict
+TABLE_TAGS = {
+    'products': (catalog_cache.PRODUCTS,),
+    'inventory': (catalog_cache.INVENTORY,),
+    'product_listing': (catalog_cache.PRODUCT_LISTING,),
+}
+
+
+def handle_notification(payload):
+    """Evict the cache entries affected by a change to table `payload`."""
+    tags = TABLE_TAGS.get(payload)
+    if tags is None:
+        logging.warning(f"Unknown catalog change notification {payload!r}; dropping the whole cache")
+        return catalog_cache.invalidate()
+    return catalog_cache.invalidate(*tags)
+
+
+class CatalogListener(threading.Thread):
+    """Daemon thread holding a LISTEN connection and reconnecting with backoff."""
+
+    def __init__(self, poll_interval=5.0, max_backoff=30.0):
+        super().__init__(name='catalog-listener', daemon=True)
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self._stop_event = threading.Event()
+        # Set once LISTEN is in place for the first time
+        self.connected = threading.Event()
+        self.conn = None
+
+    def connect(self):
+        conn = psycopg2.connect(**db.direct_connection_kwargs())
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute(f"LISTEN {CHANNEL}")
+        cur.close()
+        return conn
+
+    def drain(self, conn):
+        """Handle every notification queued on `conn`."""
+        conn.poll()
+        while conn.notifies:
+            handle_notification(conn.notifies.pop(0).payload)
+
+    def resync(self):
+        """Drop everything after (re)connecting: notifications sent while we weren't listening were missed."""
+        if self.connected.is_set():
+            catalog_cache.invalidate()
+        else:
+            # The first time that's only what this worker read while starting,
+            # not writes a replica may still be replaying: no hold, so what
+            # gunicorn.conf.py loads once `connected` is set is kept
+            catalog_cache.invalidate(hold=0.0)
+            self.connected.set()
+
+    def run(self):
+        backoff = 1.0
+        while not self._stop_event.is_set():
+            try:
+                self.conn = self.connect()
+                self.resync()
+                backoff = 1.0
+                while not self._stop_event.is_set():
+                    if select.select([self.conn], [], [], self.poll_interval)[0]:
+                        self.drain(self.conn)
+            except Exception as e:
+                if self._stop_event.is_set():
+                    break
+                logging.warning(f"Catalog listener disconnected, retrying in {backoff:g}s: {e}")
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+            finally:
+                self._close()
+
+    def _close(self):
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stop(self):
+        self._stop_event.set()
+        # Closing the socket wakes select() straight away
+        self._close()
+
+
+_listener = None
+
+
+def start():
+    """Start this process's listener (e.g. from gunicorn's post_fork). Idempotent."""
+    global _listener
+    if os.environ.get('CATALOG_LISTEN', 'true').strip().lower() in ('0', 'false', 'no', 'off'):
+        return None
+    if _listener is None or not _listener.is_alive():
+        _listener = CatalogListener()
+        _listener.start()
+    return _listener
+
+
+def stop():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify, session
 from auth.token_validator import require_auth
 import os
-import psycopg2
+from db import get_connection, DB_TIMEOUT_ERRORS, timeout_response
+import prepared_statements
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 import uuid
@@ -14,15 +15,16 @@ load_dotenv()
 
 checkout_bp = Blueprint('checkout', __name__)
 
+CHECKOUT_CART_STMT = prepared_statements.register('checkout_cart_items', """
+    SELECT ci.product_id, ci.quantity, p.price, p.name
+    FROM cart c
+    JOIN cart_items ci ON c.id = ci.cart_id
+    JOIN products p ON ci.product_id = p.id
+    WHERE c.user_id = %s
+""")
+
 def get_db_connection(cursor_factory=None):
-    conn = psycopg2.connect(
-        host=os.environ.get('DB_HOST'),
-        database=os.environ.get('DB_NAME'),
-        user=os.environ.get('DB_USER'),
-        password=os.environ.get('DB_PASSWORD'),
-        port=os.environ.get('DB_PORT', 5432),
-        sslmode=os.getenv('DB_SSLMODE', 'require')
-    )
+    conn = get_connection()
     cur = conn.cursor(cursor_factory=cursor_factory)
     return conn, cur
 
@@ -192,6 +194,9 @@ def merge_guest_cart():
         conn.commit()
         return jsonify({'success': True, 'message': 'Cart merged successfully'})
         
+    except DB_TIMEOUT_ERRORS as e:
+        conn.rollback()
+        return timeout_response(e)
     except Exception as e:
         conn.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -209,13 +214,7 @@ def checkout():
 
     try:
         # Get cart
-        cur.execute("""
-            SELECT ci.product_id, ci.quantity, p.price, p.name
-            FROM cart c
-            JOIN cart_items ci ON c.id = ci.cart_id
-            JOIN products p ON ci.product_id = p.id
-            WHERE c.user_id = %s
-        """, (user_info['id'],))
+        prepared_statements.execute(cur, CHECKOUT_CART_STMT, (user_info['id'],))
         cart_items = cur.fetchall()
 
         if not cart_items:
@@ -341,6 +340,9 @@ def checkout():
             "message": message
         }), 200
 
+    except DB_TIMEOUT_ERRORS as e:
+        conn.rollback()
+        return timeout_response(e)
     except Exception as e:
         conn.rollback()
         logging.error(f"Error during checkout: {e}")
@@ -442,6 +444,9 @@ def complete_checkout():
             'message': message
         })
         
+    except DB_TIMEOUT_ERRORS as e:
+        conn.rollback()
+        return timeout_response(e)
     except Exception as e:
         conn.rollback()
         logging.error(f"Error completing checkout: {e}")
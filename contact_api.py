@@ -1,7 +1,7 @@
 import os
 from flask import Blueprint, request, jsonify
-import psycopg2
 from psycopg2 import OperationalError, DatabaseError
+from db import get_connection, DB_TIMEOUT_ERRORS, timeout_response
 import logging
 from dotenv import load_dotenv
 import requests
@@ -13,17 +13,9 @@ contact_bp = Blueprint('contact', __name__)
 logging.basicConfig(level=logging.INFO)
 
 def get_db_connection():
-    """Create and return a database connection using environment variables."""
+    """Borrow a connection from the shared pool, or None if the database is unreachable."""
     try:
-        conn = psycopg2.connect(
-            host=os.environ.get('DB_HOST'),
-            database=os.environ.get('DB_NAME'),
-            user=os.environ.get('DB_USER'),
-            password=os.environ.get('DB_PASSWORD'),
-            port=os.environ.get('DB_PORT', 5432),
-            sslmode=os.getenv('DB_SSLMODE', 'require')  # allow override locally
-        )
-        return conn
+        return get_connection()
     except OperationalError as e:
         logging.error(f"Database connection error: {e}")
         return None
@@ -143,6 +135,9 @@ def contact():
             (name, email, phone, message)
         )
         conn.commit()
+    except DB_TIMEOUT_ERRORS as e:
+        conn.rollback()
+        return timeout_response(e)
     except DatabaseError as e:
         logging.error(f"Database error inserting contact: {e}")
         return jsonify({'success': False, 'message': 'Failed to save contact information'}), 500
@@ -0,0 +1,718 @@
+"""
+Shared PostgreSQL connection layer.
+
+Every blueprint borrows its connections from a single pool per worker process
+instead of opening a fresh (TLS) connection on every request. Connections
+handed out by get_connection() behave like plain psycopg2 connections, except
+that close() gives them back to the pool.
+
+Inside a Flask app that called init_app(), the first get_connection() of a
+request checks a connection out and binds it to flask.g; every later call in
+the same request (nested handlers, e-mail helpers, ...) reuses it, and it goes
+back to the pool in teardown_appcontext. Each request therefore costs at most
+one pool checkout.
+
+Configuration (environment):
+    DB_HOST, DB_NAME, DB_USER, DB_PASSWORD, DB_PORT, DB_SSLMODE
+    DB_POOL_MIN      connections opened eagerly when the pool is created (default 1)
+    DB_POOL_MAX      hard cap on open connections per worker (default 10)
+    DB_POOL_TIMEOUT  seconds to wait for a free connection before failing (default 5)
+    DB_POOL_MAX_LIFETIME  recycle connections older than this many seconds (default 1800)
+    DB_POOL_PRE_PING      check idle connections with SELECT 1 before handing them out (default true)
+    DB_POOL_PING_AFTER    only ping connections idle for longer than this many seconds (default 1)
+    DB_REPLICA_DSN        optional libpq DSN of a streaming read replica
+    DB_REPLICA_MAX_LAG    replica lag in seconds above which reads go to the primary (default 5)
+    DB_REPLICA_CHECK_INTERVAL  seconds between replica lag checks (default 5)
+    DB_TRANSACTION_POOLING     true when DB_HOST is a transaction-mode pooler (default false)
+    DB_DIRECT_HOST, DB_DIRECT_PORT  Postgres itself, for session-level tools (default DB_HOST/DB_PORT)
+
+Read-only routes ask for get_connection(readonly=True) and are served by the
+replica when it is configured and keeping up; everything else, and every
+write, uses the primary.
+
+Each route class (catalog, cart, default, admin) gets its own statement_timeout
+and idle_in_transaction_session_timeout, overridable with
+DB_STATEMENT_TIMEOUT_<CLASS>_MS and DB_IDLE_TX_TIMEOUT_<CLASS>_MS. A cancelled
+statement surfaces as one of DB_TIMEOUT_ERRORS, which routes turn into a 503
+with timeout_response().
+
+Behind a transaction-mode pooler such as PgBouncer (DB_TRANSACTION_POOLING=true)
+consecutive transactions may run on different server sessions, so nothing may
+rely on session state: prepared_statements.py falls back to plain SQL, and the
+route timeouts are applied with SET LOCAL semantics at the start of every
+transaction instead of once per session. Tools that do need a real session
+(migrate.py, benchmarks) connect with direct_connection_kwargs(), which honours
+DB_DIRECT_HOST / DB_DIRECT_PORT to bypass the pooler.
+
+The pool is created lazily in each process. A forked child (gunicorn worker)
+never reuses the parent's sockets; see gunicorn.conf.py for the hooks that warm
+each worker's pool before it accepts traffic.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions, errors
+from flask import g, current_app, has_app_context, jsonify, request
+from dotenv import load_dotenv
+
+from query_metrics import InstrumentedCursor
+
+load_dotenv()
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Raised when no pooled connection becomes free within the checkout timeout."""
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def connection_kwargs():
+    """Connection parameters for the primary database, read from the environment."""
+    return {
+        'host': os.environ.get('DB_HOST'),
+        'database': os.environ.get('DB_NAME'),
+        'user': os.environ.get('DB_USER'),
+        'password': os.environ.get('DB_PASSWORD'),
+        'port': os.environ.get('DB_PORT', 5432),
+        'sslmode': os.getenv('DB_SSLMODE', 'require'),
+    }
+
+
+def direct_connection_kwargs():
+    """Like connection_kwargs(), but bypassing a transaction pooler when DB_DIRECT_HOST is set."""
+    kwargs = connection_kwargs()
+    kwargs['host'] = os.environ.get('DB_DIRECT_HOST') or kwargs['host']
+    kwargs['port'] = os.environ.get('DB_DIRECT_PORT') or kwargs['port']
+    return kwargs
+
+
+def transaction_pooling():
+    """True when connections go through a transaction-mode pooler (no session state)."""
+    return _env_bool('DB_TRANSACTION_POOLING', False)
+
+
+class PoolConnection(extensions.connection):
+    """psycopg2 connection that remembers when it was opened and last returned."""
+    created_at = 0.0
+    last_used = 0.0
+    # (statement_timeout, idle_in_transaction_session_timeout) last SET on this session
+    timeouts = None
+    # Timeouts to SET LOCAL at the start of each transaction (transaction pooling)
+    local_timeouts = None
+    # Names PREPAREd on this session (see prepared_statements.py)
+    prepared_statements = None
+    stale_statements = None
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections.
+
+    Unlike psycopg2.pool.ThreadedConnectionPool, getconn() blocks for up to
+    `timeout` seconds when all `maxconn` connections are in use instead of
+    failing straight away. Connections older than `max_lifetime` are replaced,
+    and with `pre_ping` an idle connection is checked with SELECT 1 before it
+    is handed out, so a managed-Postgres failover costs a reconnect rather
+    than a 500.
+    """
+
+    def __init__(self, minconn=1, maxconn=10, timeout=5.0, max_lifetime=1800.0,
+                 pre_ping=True, ping_after=1.0, **connect_kwargs):
+        if maxconn < 1 or minconn < 0 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: min={minconn}, max={maxconn}")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.pre_ping = pre_ping
+        self.ping_after = ping_after
+        self.pid = os.getpid()
+        self._connect_kwargs = connect_kwargs
+        self._idle = deque()
+        self._size = 0  # open connections, idle + checked out
+        self._cond = threading.Condition()
+        self._closed = False
+
+        for _ in range(minconn):
+            self._idle.append(self._connect())
+            self._size += 1
+
+    def _connect(self):
+        conn = psycopg2.connect(connection_factory=PoolConnection, **self._connect_kwargs)
+        conn.created_at = conn.last_used = time.monotonic()
+        return conn
+
+    def _expired(self, conn, now):
+        return self.max_lifetime > 0 and now - conn.created_at > self.max_lifetime
+
+    def _ping(self, conn):
+        """Return True if the server still answers on this connection."""
+        try:
+            autocommit = conn.autocommit
+            conn.autocommit = True  # don't leave a transaction open behind SELECT 1
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+            finally:
+                conn.autocommit = autocommit
+            return True
+        except Exception as e:
+            logging.warning(f"Pooled connection failed pre-ping, reconnecting: {e}")
+            return False
+
+    def _usable(self, conn):
+        """Vet an idle connection before handing it out; closes it if it is not."""
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if self._expired(conn, now):
+            conn.close()
+            return False
+        if self.pre_ping and now - conn.last_used > self.ping_after and not self._ping(conn):
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return False
+        return True
+
+    def getconn(self):
+        """Check out a connection, waiting up to `timeout` seconds for one to free up."""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise psycopg2.OperationalError("Connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    # Reserve the slot before releasing the lock to connect
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f"No database connection available after {self.timeout:g}s "
+                        f"(pool max={self.maxconn})"
+                    )
+                self._cond.wait(remaining)
+
+        # The slot stays reserved while we vet or (re)open the connection
+        try:
+            if conn is not None and self._usable(conn):
+                return conn
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, rolling back any open transaction."""
+        if not discard and not conn.closed and self._expired(conn, time.monotonic()):
+            discard = True
+        if not discard and not conn.closed:
+            try:
+                status = conn.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception as e:
+                logging.warning(f"Discarding pooled connection after failed reset: {e}")
+                discard = True
+
+        with self._cond:
+            if discard or conn.closed or self._closed:
+                self._size -= 1
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            else:
+                conn.last_used = time.monotonic()
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def closeall(self):
+        """Close idle connections and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn = self._idle.pop()
+                self._size -= 1
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._cond.notify_all()
+
+
+_SET_LOCAL_TIMEOUTS = (
+    "SELECT set_config('statement_timeout', %s, true), "
+    "set_config('idle_in_transaction_session_timeout', %s, true)"
+)
+
+
+class TransactionTimeoutCursor:
+    """
+    Cursor proxy for transaction pooling mode.
+
+    Before the first statement of each transaction it sets the route's
+    timeouts with set_config(..., true), the function form of SET LOCAL, so
+    they apply to exactly that transaction on whichever server session the
+    pooler picked.
+    """
+
+    def __init__(self, cursor, conn):
+        self._cursor = cursor
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cursor.close()
+
+    def _begin(self):
+        conn = self._conn
+        timeouts = conn.local_timeouts
+        if timeouts is None or conn.autocommit:
+            return
+        if conn.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE:
+            self._cursor.execute(_SET_LOCAL_TIMEOUTS, (f"{timeouts[0]}ms", f"{timeouts[1]}ms"))
+
+    def execute(self, query, params=None):
+        self._begin()
+        return self._cursor.execute(query, params)
+
+    def executemany(self, query, params_seq):
+        self._begin()
+        return self._cursor.executemany(query, params_seq)
+
+
+def _cursor(conn, *args, **kwargs):
+    cur = conn.cursor(*args, **kwargs)
+    if conn.local_timeouts is not None:
+        cur = TransactionTimeoutCursor(cur, conn)
+    return cur
+
+
+class PooledConnection:
+    """
+    Proxy for a connection borrowed from a ConnectionPool.
+
+    Everything is delegated to the underlying psycopg2 connection; close()
+    returns it to the pool instead of closing the socket, so existing
+    `conn.close()` calls in the routes keep working unchanged.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        if self._conn is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return _cursor(self._conn, *args, **kwargs)
+
+    @property
+    def closed(self):
+        return 1 if self._conn is None else self._conn.closed
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.putconn(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # Safety net for code paths that forget to close(); never raise from here
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class RequestConnection:
+    """
+    Handle on the connection bound to the current request.
+
+    close() ends whatever transaction the caller left open (uncommitted work is
+    rolled back, exactly as closing a real connection would) but keeps the
+    connection checked out for the next helper in the same request.
+
+    Cursors are instrumented so the request's query count and DB time can be
+    reported (see query_metrics.py).
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._closed = False
+
+    def __getattr__(self, name):
+        if self._closed:
+            raise psycopg2.InterfaceError("connection already closed")
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        if self._closed:
+            raise psycopg2.InterfaceError("connection already closed")
+        return InstrumentedCursor(_cursor(self._conn, *args, **kwargs))
+
+    @property
+    def closed(self):
+        return 1 if self._closed else self._conn.closed
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._conn.closed:
+            return
+        try:
+            if self._conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                self._conn.rollback()
+        except Exception as e:
+            logging.warning(f"Failed to reset request connection: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+PRIMARY = 'primary'
+REPLICA = 'replica'
+
+# Route classes: (statement_timeout ms, idle_in_transaction_session_timeout ms)
+CATALOG = 'catalog'
+CART = 'cart'
+DEFAULT = 'default'
+ADMIN = 'admin'
+ROUTE_TIMEOUTS = {
+    CATALOG: (2000, 5000),
+    CART: (3000, 5000),
+    DEFAULT: (5000, 10000),
+    ADMIN: (30000, 60000),
+}
+
+# Raised when a statement was cancelled by one of those timeouts
+DB_TIMEOUT_ERRORS = (errors.QueryCanceled, errors.IdleInTransactionSessionTimeout)
+
+_pools = {}
+_pool_lock = threading.Lock()
+# Pools inherited across fork(); kept referenced so their sockets are never closed
+_orphaned_pools = []
+
+# Last replica lag check, shared by every request in this worker
+_replica_state = {'checked_at': None, 'healthy': False}
+
+_EXTENSION_KEY = 'db'
+
+
+def replica_connection_kwargs():
+    """Connection parameters for the read replica, or None when DB_REPLICA_DSN is unset."""
+    dsn = os.environ.get('DB_REPLICA_DSN')
+    if not dsn:
+        return None
+    kwargs = {'dsn': dsn}
+    if 'sslmode' not in dsn:
+        kwargs['sslmode'] = os.getenv('DB_SSLMODE', 'require')
+    return kwargs
+
+
+def _create_pool(connect_kwargs):
+    return ConnectionPool(
+        minconn=_env_int('DB_POOL_MIN', 1),
+        maxconn=_env_int('DB_POOL_MAX', 10),
+        timeout=_env_float('DB_POOL_TIMEOUT', 5.0),
+        max_lifetime=_env_float('DB_POOL_MAX_LIFETIME', 1800.0),
+        pre_ping=_env_bool('DB_POOL_PRE_PING', True),
+        ping_after=_env_float('DB_POOL_PING_AFTER', 1.0),
+        **connect_kwargs
+    )
+
+
+def _get_named_pool(name, connect_kwargs):
+    pool = _pools.get(name)
+    if pool is not None and pool.pid != os.getpid():
+        _reset_after_fork()
+        pool = None
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                pool = _pools[name] = _create_pool(connect_kwargs)
+    return pool
+
+
+def get_pool():
+    """Return this process's primary pool, creating it on first use."""
+    return _get_named_pool(PRIMARY, connection_kwargs())
+
+
+def get_replica_pool():
+    """Return this process's replica pool, or None when no replica is configured."""
+    kwargs = replica_connection_kwargs()
+    if kwargs is None:
+        return None
+    return _get_named_pool(REPLICA, kwargs)
+
+
+def warm_pool():
+    """Create this process's pools now, opening DB_POOL_MIN connections up front."""
+    pool = get_pool()
+    try:
+        get_replica_pool()
+    except Exception as e:
+        logging.warning(f"Read replica unavailable while warming pool: {e}")
+    return pool
+
+
+def _reset_after_fork():
+    """
+    Forget the parent's pools in a freshly forked child.
+
+    The inherited sockets belong to the parent's sessions. Closing them, or
+    letting them be garbage collected (which also closes them), would
+    terminate those sessions for the parent, so they are parked untouched.
+    """
+    global _pool_lock
+    _orphaned_pools.extend(_pools.values())
+    _pools.clear()
+    _pool_lock = threading.Lock()
+    _replica_state.update(checked_at=None, healthy=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _checkout():
+    pool = get_pool()
+    return PooledConnection(pool, pool.getconn())
+
+
+def replica_lag(conn):
+    """Seconds the replica behind `conn` trails the primary (0 when fully replayed)."""
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT CASE
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+            END
+        """)
+        return float(cur.fetchone()[0])
+    finally:
+        cur.close()
+
+
+def _checkout_replica():
+    """
+    Borrow a replica connection, or return None so the caller uses the primary.
+
+    The replica is skipped while it is unreachable or lagging by more than
+    DB_REPLICA_MAX_LAG seconds. The verdict is cached for
+    DB_REPLICA_CHECK_INTERVAL seconds so the lag query doesn't run per request.
+    """
+    if replica_connection_kwargs() is None:
+        return None
+
+    interval = _env_float('DB_REPLICA_CHECK_INTERVAL', 5.0)
+    now = time.monotonic()
+    checked_at = _replica_state['checked_at']
+    fresh = checked_at is not None and now - checked_at < interval
+    if fresh and not _replica_state['healthy']:
+        return None
+
+    try:
+        pool = get_replica_pool()
+        conn = PooledConnection(pool, pool.getconn())
+    except Exception as e:
+        logging.warning(f"Read replica unavailable, using primary: {e}")
+        _replica_state.update(checked_at=now, healthy=False)
+        return None
+
+    if not fresh:
+        max_lag = _env_float('DB_REPLICA_MAX_LAG', 5.0)
+        try:
+            lag = replica_lag(conn)
+            healthy = lag <= max_lag
+            if not healthy:
+                logging.warning(f"Read replica lagging {lag:.1f}s (max {max_lag:g}s), using primary")
+        except Exception as e:
+            logging.warning(f"Read replica lag check failed, using primary: {e}")
+            healthy = False
+        _replica_state.update(checked_at=now, healthy=healthy)
+        if not healthy:
+            conn.close()
+            return None
+    return conn
+
+
+def route_timeouts(route_class):
+    """(statement_timeout, idle_in_transaction_session_timeout) in ms for `route_class`."""
+    statement_ms, idle_ms = ROUTE_TIMEOUTS.get(route_class, ROUTE_TIMEOUTS[DEFAULT])
+    name = route_class.upper()
+    return (
+        _env_int(f'DB_STATEMENT_TIMEOUT_{name}_MS', statement_ms),
+        _env_int(f'DB_IDLE_TX_TIMEOUT_{name}_MS', idle_ms),
+    )
+
+
+def apply_timeouts(conn, route_class):
+    """
+    Set the session timeouts for `route_class` on `conn` (a PoolConnection).
+
+    Skipped when the session already has them, and while a transaction is
+    open: a SET inside a transaction that later rolls back would be undone.
+    In transaction pooling mode nothing is sent here; the connection's
+    cursors SET LOCAL the timeouts per transaction instead.
+    """
+    wanted = route_timeouts(route_class)
+    if transaction_pooling():
+        conn.local_timeouts = wanted
+        return
+    conn.local_timeouts = None
+    if conn.timeouts == wanted:
+        return
+    if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+        return
+    autocommit = conn.autocommit
+    try:
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT set_config('statement_timeout', %s, false), "
+            "set_config('idle_in_transaction_session_timeout', %s, false)",
+            (f"{wanted[0]}ms", f"{wanted[1]}ms"))
+        cur.close()
+        conn.timeouts = wanted
+    finally:
+        conn.autocommit = autocommit
+
+
+def timeout_response(exc=None):
+    """503 for a request whose statement was cancelled by its route's timeout."""
+    logging.warning(f"Database timeout on {request.method} {request.path}: {exc}")
+    response = jsonify({
+        'success': False,
+        'message': 'The server is busy right now. Please try again in a moment.'
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+def get_connection(readonly=False, route_class=DEFAULT):
+    """
+    Borrow a connection from the shared pool. Call close() when done with it.
+
+    With readonly=True the connection comes from the read replica when one is
+    configured and healthy, otherwise from the primary. Writes must never ask
+    for a readonly connection. `route_class` picks the session's statement
+    and idle-in-transaction timeouts (see ROUTE_TIMEOUTS).
+
+    During a request (after init_app) this returns a handle on the request's
+    connection, checking one out only on the first call. A read issued after
+    the request already holds a primary connection reuses it, so a request
+    always sees its own writes.
+    """
+    if has_app_context() and _EXTENSION_KEY in current_app.extensions:
+        conn = g.get('_db_conn')
+        if readonly and (conn is None or conn.closed):
+            conn = g.get('_db_read_conn')
+            if conn is None or conn.closed:
+                conn = _checkout_replica()
+                if conn is not None:
+                    g._db_read_conn = conn
+        if conn is None or conn.closed:
+            conn = g._db_conn = _checkout()
+        _apply_timeouts_or_release(conn, route_class, scoped=True)
+        return RequestConnection(conn)
+
+    conn = _checkout_replica() if readonly else None
+    if conn is None:
+        conn = _checkout()
+    _apply_timeouts_or_release(conn, route_class)
+    return conn
+
+
+def _apply_timeouts_or_release(conn, route_class, scoped=False):
+    try:
+        apply_timeouts(conn._conn, route_class)
+    except Exception:
+        if not scoped:
+            conn.close()
+        raise
+
+
+def release_request_connection(exc=None):
+    """teardown_appcontext hook: give the request's connections back to their pools."""
+    for key in ('_db_conn', '_db_read_conn'):
+        conn = g.pop(key, None)
+        if conn is not None:
+            conn.close()
+
+
+def init_app(app):
+    """Enable per-request connection reuse and timeout-to-503 mapping for `app`."""
+    app.extensions[_EXTENSION_KEY] = True
+    app.teardown_appcontext(release_request_connection)
+    for error in DB_TIMEOUT_ERRORS:
+        app.register_error_handler(error, timeout_response)
+
+
+def close_pool():
+    """Close every idle connection and drop the pools (e.g. on worker shutdown)."""
+    with _pool_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.closeall()
@@ -0,0 +1,25 @@
+"""
+Sparse fieldsets (?fields=) for the catalog routes.
+
+A client lists the response keys it needs, e.g. ?fields=id,title,price,image.
+Each route maps those keys onto its SQL, so fields that aren't asked for are
+never selected or joined, let alone serialized.
+"""
+
+
+def parse_fields(value, allowed, default=None):
+    """
+    Parse a comma-separated ?fields= value against `allowed` (an ordered
+    collection of field names).
+
+    Returns the requested names in `allowed` order, or `default` (all of
+    `allowed` when None) when `value` is None or blank. Raises ValueError
+    naming any unknown field.
+    """
+    if value is None or not value.strip():
+        return list(allowed if default is None else default)
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = sorted(requested.difference(allowed))
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return [name for name in allowed if name in requested]
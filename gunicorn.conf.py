@@ -0,0 +1,70 @@
+"""
+Gunicorn hooks for the shared DB pool (see db.py).
+
+Gunicorn loads this file automatically from the working directory. Each worker
+gets its own pool, created after fork and warmed before the worker starts
+accepting requests; the pool is closed when the worker exits. Each worker also
+starts its catalog cache listener (see catalog_listener.py) and loads its
+product indexes (see product_index.py) after fork. The master runs the
+scheduled product_listing refresh (see product_listing.py) as a child process
+for as long as it runs.
+"""
+import logging
+
+import db
+import catalog_listener
+import product_index
+import product_listing
+
+# Seconds post_fork waits for the catalog listener's first connect
+LISTEN_WAIT = 5.0
+
+_scheduler = None
+
+
+def when_ready(server):
+    global _scheduler
+    # One scheduler for the whole server, not one per worker
+    try:
+        _scheduler = product_listing.start_scheduler()
+        if _scheduler is not None:
+            server.log.info(f"product_listing refresh scheduler started (pid {_scheduler.pid})")
+    except Exception as e:
+        logging.error(f"Failed to start the product_listing refresh scheduler: {e}")
+
+
+def on_exit(server):
+    if _scheduler is not None:
+        _scheduler.terminate()
+        try:
+            _scheduler.wait(timeout=5)
+        except Exception:
+            _scheduler.kill()
+
+
+def post_fork(server, worker):
+    # db drops any pool inherited from the master on fork; open this worker's now
+    try:
+        db.warm_pool()
+        server.log.info(f"Worker {worker.pid}: database pool warmed")
+    except Exception as e:
+        # Don't kill the worker; the pool is created lazily on first request instead
+        logging.error(f"Worker {worker.pid}: failed to warm database pool: {e}")
+    # Threads don't survive fork(), so the listener has to start here
+    listener = catalog_listener.start()
+    # Load the indexes only once LISTEN is in place, so no change slips in
+    # between; if that takes too long they are loaded on first use instead
+    if listener is not None and not listener.connected.wait(LISTEN_WAIT):
+        logging.warning(f"Worker {worker.pid}: catalog listener not connected yet; product indexes load on first use")
+        return
+    try:
+        codes, names = product_index.warm()
+        server.log.info(f"Worker {worker.pid}: product indexes loaded ({codes} codes, {names} name keys)")
+    except Exception as e:
+        # Loaded on first use instead
+        logging.error(f"Worker {worker.pid}: failed to load product indexes: {e}")
+
+
+def worker_exit(server, worker):
+    catalog_listener.stop()
+    db.close_pool()
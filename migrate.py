@@ -0,0 +1,241 @@
+"""
+Apply the versioned SQL migrations in migrations/.
+
+Run with: python migrate.py            apply pending migrations
+          python migrate.py --status   list applied and pending migrations
+
+Migrations are applied in filename order and recorded in schema_migrations.
+
+A migration that uses CONCURRENTLY (CREATE INDEX CONCURRENTLY, REFRESH
+MATERIALIZED VIEW CONCURRENTLY, ...) is run statement by statement in
+autocommit mode, because Postgres refuses those inside a transaction block.
+Such files must be idempotent (IF NOT EXISTS) so rerunning one after a failure
+is safe; an INVALID index left behind by an interrupted concurrent build is
+dropped and rebuilt. Every other migration runs in a single transaction.
+
+Sessions use a short lock_timeout (DB_MIGRATION_LOCK_TIMEOUT, default 5s) so a
+migration never queues behind a long-running transaction while the routes
+queue behind it; a statement that times out waiting for its lock is retried
+(DB_MIGRATION_RETRIES, default 5) with a growing pause. Those settings are
+session state, so migrations connect to Postgres directly (DB_DIRECT_HOST)
+rather than through a transaction pooler.
+"""
+import os
+import re
+import sys
+import time
+import logging
+
+import psycopg2
+from psycopg2 import errors
+from dotenv import load_dotenv
+
+import db
+
+load_dotenv()
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+_CONCURRENT_INDEX = re.compile(
+    r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+"?(\w+)"?', re.I)
+
+
+def split_statements(sql):
+    """
+    Split a migration file into statements, dropping comments.
+
+    Semicolons inside quotes, quoted identifiers and dollar-quoted bodies
+    (function definitions) do not end a statement.
+    """
+    statements = []
+    current = []
+    i, n = 0, len(sql)
+    while i < n:
+        ch = sql[i]
+        if sql.startswith('--', i):
+            end = sql.find('\n', i)
+            i = n if end == -1 else end
+            continue
+        if sql.startswith('/*', i):
+            end = sql.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+            current.append(' ')
+            continue
+        if ch in ("'", '"'):
+            end = i + 1
+            while end < n:
+                if sql[end] == ch:
+                    if end + 1 < n and sql[end + 1] == ch:  # escaped quote
+                        end += 2
+                        continue
+                    break
+                end += 1
+            current.append(sql[i:end + 1])
+            i = end + 1
+            continue
+        if ch == '$':
+            tag = re.match(r'\$(?:[A-Za-z_]\w*)?\$', sql[i:])
+            if tag:
+                end = sql.find(tag.group(0), i + len(tag.group(0)))
+                end = n if end == -1 else end + len(tag.group(0))
+                current.append(sql[i:end])
+                i = end
+                continue
+        if ch == ';':
+            statement = ''.join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+            i += 1
+            continue
+        current.append(ch)
+        i += 1
+
+    statement = ''.join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+
+def requires_autocommit(statements):
+    """True when any statement must run outside a transaction block."""
+    return any(re.search(r'\bCONCURRENTLY\b', s, re.I) for s in statements)
+
+
+def discover():
+    """Return [(version, path)] for every migration file, in order."""
+    if not os.path.isdir(MIGRATIONS_DIR):
+        return []
+    return [
+        (name[:-len('.sql')], os.path.join(MIGRATIONS_DIR, name))
+        for name in sorted(os.listdir(MIGRATIONS_DIR))
+        if name.endswith('.sql')
+    ]
+
+
+def _env_number(name, default, cast):
+    try:
+        return cast(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def connect():
+    conn = psycopg2.connect(**db.direct_connection_kwargs())
+    conn.autocommit = True
+    cur = conn.cursor()
+    lock_timeout = _env_number('DB_MIGRATION_LOCK_TIMEOUT', 5, float)
+    cur.execute("SELECT set_config('lock_timeout', %s, false)", (f"{int(lock_timeout * 1000)}ms",))
+    # Index builds can legitimately run for a long time; only lock waits are bounded
+    cur.execute("SET statement_timeout = 0")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(255) PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.close()
+    return conn
+
+
+def applied_versions(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT version FROM schema_migrations")
+    versions = {row[0] for row in cur.fetchall()}
+    cur.close()
+    return versions
+
+
+def _drop_invalid_index(cur, statement):
+    """Drop an INVALID index left by an interrupted CONCURRENTLY build of `statement`."""
+    match = _CONCURRENT_INDEX.search(statement)
+    if not match:
+        return
+    cur.execute("""
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND NOT i.indisvalid
+    """, (match.group(1),))
+    if cur.fetchone():
+        logging.warning(f"Dropping invalid index {match.group(1)} left by an earlier build")
+        cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{match.group(1)}"')
+
+
+def _with_lock_retries(fn):
+    retries = _env_number('DB_MIGRATION_RETRIES', 5, int)
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except errors.LockNotAvailable as e:
+            if attempt == retries:
+                raise
+            pause = 2 ** attempt
+            logging.warning(f"Lock not available ({e}); retrying in {pause}s")
+            time.sleep(pause)
+
+
+def apply_migration(conn, version, path):
+    with open(path) as f:
+        statements = split_statements(f.read())
+    cur = conn.cursor()
+    try:
+        if requires_autocommit(statements):
+            for statement in statements:
+                def run(statement=statement):
+                    _drop_invalid_index(cur, statement)
+                    cur.execute(statement)
+                _with_lock_retries(run)
+            cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+        else:
+            def run_all():
+                conn.autocommit = False
+                try:
+                    for statement in statements:
+                        cur.execute(statement)
+                    cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    conn.autocommit = True
+            _with_lock_retries(run_all)
+    finally:
+        cur.close()
+
+
+def migrate():
+    conn = connect()
+    try:
+        done = applied_versions(conn)
+        pending = [(v, p) for v, p in discover() if v not in done]
+        if not pending:
+            print("Database is up to date.")
+            return 0
+        for version, path in pending:
+            print(f"Applying {version} ...")
+            start = time.monotonic()
+            apply_migration(conn, version, path)
+            print(f"  done in {time.monotonic() - start:.1f}s")
+        return 0
+    finally:
+        conn.close()
+
+
+def status():
+    conn = connect()
+    try:
+        done = applied_versions(conn)
+        for version, _ in discover():
+            print(f"{'applied' if version in done else 'pending'}  {version}")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1 and sys.argv[1] == '--status':
+        sys.exit(status())
+    sys.exit(migrate())
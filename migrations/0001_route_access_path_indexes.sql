@@ -0,0 +1,29 @@
+-- Indexes for the access paths the routes actually use.
+-- Built CONCURRENTLY so writes keep flowing while they build; migrate.py runs
+-- each statement on its own, outside a transaction, and drops any INVALID
+-- leftover from an interrupted build before retrying it.
+
+-- /orders, /admin/orders and admin_dashboard join order_items on order_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_order_items_order_id
+    ON order_items (order_id);
+
+-- Primary-image subquery in get_products, images in get_product_detail
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_product_images_product_primary
+    ON product_images (product_id, is_primary);
+
+-- Latest reviews per product in get_product_detail
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_product_reviews_product_created
+    ON product_reviews (product_id, created_at DESC);
+
+-- GET /orders: a customer's orders, newest first
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_customer_created
+    ON orders (customer_id, created_at DESC);
+
+-- Abandoned-cart cleanup by age
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_cart_created_at
+    ON cart (created_at);
+
+-- Low-stock list on the admin dashboard
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_inventory_low_stock
+    ON inventory (quantity)
+    WHERE quantity < 10;
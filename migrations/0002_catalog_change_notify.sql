@@ -0,0 +1,34 @@
+-- Tell every worker when catalog data changes, so its in-process cache
+-- (catalog_cache.py) can drop the affected entries right away instead of
+-- waiting for them to expire. catalog_listener.py LISTENs on the channel.
+--
+-- Statement-level triggers: one notification per statement, not per row.
+-- Postgres delivers them on commit and folds identical payloads sent in the
+-- same transaction, so a bulk update costs one message per table.
+
+CREATE OR REPLACE FUNCTION notify_catalog_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('catalog_changes', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_notify_catalog_change ON products;
+CREATE TRIGGER products_notify_catalog_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON products
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_change();
+
+DROP TRIGGER IF EXISTS inventory_notify_catalog_change ON inventory;
+CREATE TRIGGER inventory_notify_catalog_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON inventory
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_change();
+
+DROP TRIGGER IF EXISTS product_images_notify_catalog_change ON product_images;
+CREATE TRIGGER product_images_notify_catalog_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON product_images
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_change();
+
+DROP TRIGGER IF EXISTS provinces_notify_catalog_change ON provinces;
+CREATE TRIGGER provinces_notify_catalog_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON provinces
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_change();
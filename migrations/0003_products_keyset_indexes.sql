@@ -0,0 +1,9 @@
+-- Keyset pagination for GET /products: pages are read in (name, id) order
+-- and resume with (p.name, p.id) > (cursor), so both columns must be indexed
+-- together for the seek to avoid a sort.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_name_id
+    ON products (name, id);
+
+-- ?type= is the filter the catalog pages use most; keep it in index order too
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_type_name_id
+    ON products (type, name, id);
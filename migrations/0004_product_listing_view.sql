@@ -0,0 +1,60 @@
+-- Everything GET /products shows for a product, precomputed: primary image,
+-- stock, the type-specific headline attributes and the review summary.
+-- The listing becomes a plain index scan of one relation instead of a join
+-- plus a correlated image subquery per row.
+--
+-- product_listing.py refreshes it (REFRESH MATERIALIZED VIEW CONCURRENTLY,
+-- which needs the unique index on id) after admin writes and on a schedule.
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS product_listing AS
+SELECT
+    p.id,
+    p.name,
+    p.official_name,
+    p.price,
+    p.description,
+    p.product_code,
+    p.type,
+    p.material,
+    p.food_safe,
+    p.recyclable,
+    p.heat_resistant,
+    img.image_url AS primary_image,
+    i.quantity AS stock,
+    jsonb_strip_nulls(CASE p.type
+        WHEN 'aluminum_shape' THEN jsonb_build_object(
+            'diameter_mm', a.diameter_mm, 'height_mm', a.height_mm, 'volume_cm3', a.volume_cm3)
+        WHEN 'cardboard_lid' THEN jsonb_build_object(
+            'width_mm', cl.width_mm, 'length_mm', cl.length_mm)
+        WHEN 'pack' THEN jsonb_build_object('pack_size', pk.pack_size)
+        ELSE '{}'::jsonb
+    END) AS attributes,
+    COALESCE(r.average_rating, 0) AS average_rating,
+    COALESCE(r.review_count, 0) AS review_count
+FROM products p
+LEFT JOIN inventory i ON i.product_id = p.id
+LEFT JOIN (
+    SELECT DISTINCT ON (product_id) product_id, image_url
+    FROM product_images
+    WHERE is_primary = TRUE
+    ORDER BY product_id, id
+) img ON img.product_id = p.id
+LEFT JOIN aluminum_shapes a ON a.product_id = p.id
+LEFT JOIN cardboard_lids cl ON cl.product_id = p.id
+LEFT JOIN product_packs pk ON pk.product_id = p.id
+LEFT JOIN (
+    SELECT product_id, ROUND(AVG(rating), 2) AS average_rating, COUNT(*) AS review_count
+    FROM product_reviews
+    GROUP BY product_id
+) r ON r.product_id = p.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_product_listing_id
+    ON product_listing (id);
+
+-- Keyset pagination: pages are read in (name, id) order, and ?type= is the
+-- filter the catalog pages use most
+CREATE INDEX IF NOT EXISTS idx_product_listing_name_id
+    ON product_listing (name, id);
+
+CREATE INDEX IF NOT EXISTS idx_product_listing_type_name_id
+    ON product_listing (type, name, id);
@@ -0,0 +1,123 @@
+-- Running review aggregates per product, so the detail page and the listing
+-- read a product's average and count from one row instead of aggregating all
+-- of its reviews (thousands for the best sellers) on every request.
+--
+-- They live in their own table rather than on products: a review then only
+-- touches this small row, and doesn't rewrite the products row or fire its
+-- catalog change notification (0002) on every review.
+--
+-- review_count counts every review (total_reviews); rated_count and
+-- rating_sum only those with a rating, so like AVG(rating):
+-- average rating = rating_sum / rated_count
+
+CREATE TABLE IF NOT EXISTS product_review_stats (
+    product_id INT PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+    review_count INT NOT NULL DEFAULT 0,
+    rated_count INT NOT NULL DEFAULT 0,
+    rating_sum NUMERIC NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION bump_product_review_stats(pid INT, delta INT, review_rating NUMERIC)
+RETURNS void AS $$
+BEGIN
+    -- delta is 1 for a review added, -1 for one removed
+    INSERT INTO product_review_stats AS s (product_id, review_count, rated_count, rating_sum)
+    VALUES (pid, delta, CASE WHEN review_rating IS NULL THEN 0 ELSE delta END, delta * COALESCE(review_rating, 0))
+    ON CONFLICT (product_id) DO UPDATE
+        SET review_count = s.review_count + EXCLUDED.review_count,
+            rated_count = s.rated_count + EXCLUDED.rated_count,
+            rating_sum = s.rating_sum + EXCLUDED.rating_sum;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION maintain_product_review_stats() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.product_id IS NOT NULL THEN
+        PERFORM bump_product_review_stats(OLD.product_id, -1, OLD.rating);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.product_id IS NOT NULL THEN
+        PERFORM bump_product_review_stats(NEW.product_id, 1, NEW.rating);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION clear_product_review_stats() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM product_review_stats;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- No review may be written between the backfill and the triggers taking over
+LOCK TABLE product_reviews IN SHARE MODE;
+
+DROP TRIGGER IF EXISTS product_reviews_maintain_stats ON product_reviews;
+CREATE TRIGGER product_reviews_maintain_stats
+    AFTER INSERT OR DELETE OR UPDATE OF product_id, rating ON product_reviews
+    FOR EACH ROW EXECUTE FUNCTION maintain_product_review_stats();
+
+DROP TRIGGER IF EXISTS product_reviews_clear_stats ON product_reviews;
+CREATE TRIGGER product_reviews_clear_stats
+    AFTER TRUNCATE ON product_reviews
+    FOR EACH STATEMENT EXECUTE FUNCTION clear_product_review_stats();
+
+INSERT INTO product_review_stats (product_id, review_count, rated_count, rating_sum)
+SELECT product_id, COUNT(*), COUNT(rating), COALESCE(SUM(rating), 0)
+FROM product_reviews
+WHERE product_id IS NOT NULL
+GROUP BY product_id
+ON CONFLICT (product_id) DO UPDATE
+    SET review_count = EXCLUDED.review_count,
+        rated_count = EXCLUDED.rated_count,
+        rating_sum = EXCLUDED.rating_sum;
+
+-- Rebuild the listing view (0004) on the aggregates; same columns and indexes
+DROP MATERIALIZED VIEW IF EXISTS product_listing;
+
+CREATE MATERIALIZED VIEW product_listing AS
+SELECT
+    p.id,
+    p.name,
+    p.official_name,
+    p.price,
+    p.description,
+    p.product_code,
+    p.type,
+    p.material,
+    p.food_safe,
+    p.recyclable,
+    p.heat_resistant,
+    img.image_url AS primary_image,
+    i.quantity AS stock,
+    jsonb_strip_nulls(CASE p.type
+        WHEN 'aluminum_shape' THEN jsonb_build_object(
+            'diameter_mm', a.diameter_mm, 'height_mm', a.height_mm, 'volume_cm3', a.volume_cm3)
+        WHEN 'cardboard_lid' THEN jsonb_build_object(
+            'width_mm', cl.width_mm, 'length_mm', cl.length_mm)
+        WHEN 'pack' THEN jsonb_build_object('pack_size', pk.pack_size)
+        ELSE '{}'::jsonb
+    END) AS attributes,
+    COALESCE(ROUND(rs.rating_sum / NULLIF(rs.rated_count, 0), 2), 0) AS average_rating,
+    COALESCE(rs.review_count, 0) AS review_count
+FROM products p
+LEFT JOIN inventory i ON i.product_id = p.id
+LEFT JOIN (
+    SELECT DISTINCT ON (product_id) product_id, image_url
+    FROM product_images
+    WHERE is_primary = TRUE
+    ORDER BY product_id, id
+) img ON img.product_id = p.id
+LEFT JOIN aluminum_shapes a ON a.product_id = p.id
+LEFT JOIN cardboard_lids cl ON cl.product_id = p.id
+LEFT JOIN product_packs pk ON pk.product_id = p.id
+LEFT JOIN product_review_stats rs ON rs.product_id = p.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_product_listing_id
+    ON product_listing (id);
+
+CREATE INDEX IF NOT EXISTS idx_product_listing_name_id
+    ON product_listing (name, id);
+
+CREATE INDEX IF NOT EXISTS idx_product_listing_type_name_id
+    ON product_listing (type, name, id);
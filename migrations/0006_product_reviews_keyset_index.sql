@@ -0,0 +1,8 @@
+-- /product/<id>/reviews pages a product's reviews in (created_at, id) order
+-- and resumes with (created_at, id) < (cursor), so the index needs id as the
+-- tie-breaker for the seek to land exactly after the cursor on every page.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_product_reviews_product_created_id
+    ON product_reviews (product_id, created_at DESC, id DESC);
+
+-- Its prefix covers everything the old (product_id, created_at DESC) index did
+DROP INDEX CONCURRENTLY IF EXISTS idx_product_reviews_product_created;
@@ -0,0 +1,26 @@
+-- /products/search: full-text search over code, name, official name and
+-- description, ranked with ts_rank, plus trigram similarity on name and code
+-- for queries full-text search can't match (typos, partial codes).
+--
+-- The search document is an expression index rather than a stored column:
+-- adding a generated column would rewrite products under an ACCESS EXCLUSIVE
+-- lock. The expression must stay identical to SEARCH_DOCUMENT in
+-- product_api.py for the planner to use the index; the code and name weigh
+-- most. Built CONCURRENTLY, so this file runs statement by statement outside
+-- a transaction and every statement is idempotent.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_search_document
+    ON products USING GIN ((
+        setweight(to_tsvector('simple', coalesce(product_code, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(official_name, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'C')
+    ));
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_name_trgm
+    ON products USING GIN (name gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_code_trgm
+    ON products USING GIN (product_code gin_trgm_ops);
@@ -0,0 +1,54 @@
+-- Add eco_friendly to the product_listing view (0004, 0005), so the listing
+-- can filter on it and /products/facets can count it from the same snapshot
+-- as everything else. Same columns otherwise, same indexes.
+
+DROP MATERIALIZED VIEW IF EXISTS product_listing;
+
+CREATE MATERIALIZED VIEW product_listing AS
+SELECT
+    p.id,
+    p.name,
+    p.official_name,
+    p.price,
+    p.description,
+    p.product_code,
+    p.type,
+    p.material,
+    p.food_safe,
+    p.recyclable,
+    p.heat_resistant,
+    p.eco_friendly,
+    img.image_url AS primary_image,
+    i.quantity AS stock,
+    jsonb_strip_nulls(CASE p.type
+        WHEN 'aluminum_shape' THEN jsonb_build_object(
+            'diameter_mm', a.diameter_mm, 'height_mm', a.height_mm, 'volume_cm3', a.volume_cm3)
+        WHEN 'cardboard_lid' THEN jsonb_build_object(
+            'width_mm', cl.width_mm, 'length_mm', cl.length_mm)
+        WHEN 'pack' THEN jsonb_build_object('pack_size', pk.pack_size)
+        ELSE '{}'::jsonb
+    END) AS attributes,
+    COALESCE(ROUND(rs.rating_sum / NULLIF(rs.rated_count, 0), 2), 0) AS average_rating,
+    COALESCE(rs.review_count, 0) AS review_count
+FROM products p
+LEFT JOIN inventory i ON i.product_id = p.id
+LEFT JOIN (
+    SELECT DISTINCT ON (product_id) product_id, image_url
+    FROM product_images
+    WHERE is_primary = TRUE
+    ORDER BY product_id, id
+) img ON img.product_id = p.id
+LEFT JOIN aluminum_shapes a ON a.product_id = p.id
+LEFT JOIN cardboard_lids cl ON cl.product_id = p.id
+LEFT JOIN product_packs pk ON pk.product_id = p.id
+LEFT JOIN product_review_stats rs ON rs.product_id = p.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_product_listing_id
+    ON product_listing (id);
+
+-- Keyset pagination and the ?type= filter
+CREATE INDEX IF NOT EXISTS idx_product_listing_name_id
+    ON product_listing (name, id);
+
+CREATE INDEX IF NOT EXISTS idx_product_listing_type_name_id
+    ON product_listing (type, name, id);
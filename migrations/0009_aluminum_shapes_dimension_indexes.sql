@@ -0,0 +1,7 @@
+-- /products/shapes: volume range scans in volume order (product_id breaks
+-- ties the way the route orders them), and diameter/height footprint matches.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_aluminum_shapes_volume
+    ON aluminum_shapes (volume_cm3, product_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_aluminum_shapes_diameter_height
+    ON aluminum_shapes (diameter_mm, height_mm);
@@ -0,0 +1,6 @@
+-- GET /products pages the product_listing view (0004) in (name, id) order
+-- now, on that view's own indexes, and nothing else reads products in
+-- (name, id) or (type, name, id) order, so the 0003 indexes only slow down
+-- every write to products.
+DROP INDEX CONCURRENTLY IF EXISTS idx_products_name_id;
+DROP INDEX CONCURRENTLY IF EXISTS idx_products_type_name_id;
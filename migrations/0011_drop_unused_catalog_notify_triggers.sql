@@ -0,0 +1,5 @@
+-- No cached response is built from product_images or provinces (the listing
+-- reads images through the product_listing view, which sends its own
+-- notification when refreshed), so their 0002 notifications evicted nothing.
+DROP TRIGGER IF EXISTS product_images_notify_catalog_change ON product_images;
+DROP TRIGGER IF EXISTS provinces_notify_catalog_change ON provinces;
@@ -2,7 +2,8 @@ from flask import Blueprint, request, jsonify
 from auth.token_validator import require_auth
 from dotenv import load_dotenv
 import os
-import psycopg2
+from db import get_connection, DB_TIMEOUT_ERRORS, timeout_response
+import product_listing
 import uuid  # added import
 
 load_dotenv()
@@ -10,14 +11,7 @@ load_dotenv()
 order_bp = Blueprint('order', __name__)
 
 def get_db_connection():
-    conn = psycopg2.connect(
-        host=os.environ.get('DB_HOST'),
-        database=os.environ.get('DB_NAME'),
-        user=os.environ.get('DB_USER'),
-        password=os.environ.get('DB_PASSWORD'),
-        port=os.environ.get('DB_PORT', 5432),
-        sslmode=os.getenv('DB_SSLMODE', 'require')
-    )
+    conn = get_connection()
     cur = conn.cursor()
     return conn, cur
 
@@ -97,9 +91,14 @@ def checkout():
         """, (user_id,))
 
         conn.commit()
+        # Stock levels in the listing just changed
+        product_listing.request_refresh()
 
         return jsonify({'success': True, 'order_id': order_id}), 201
 
+    except DB_TIMEOUT_ERRORS as e:
+        conn.rollback()
+        return timeout_response(e)
     except Exception as e:
         conn.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -112,8 +111,7 @@ def checkout():
 @require_auth
 def get_orders():
     user_id = request.user['sub']
-    conn = get_db_connection()
-    cur = conn.cursor()
+    conn, cur = get_db_connection()
     try:
         cur.execute("""
             SELECT o.id, o.status, o.created_at, 
@@ -167,6 +165,10 @@ def create_order():
         order_id = cur.fetchone()[0]
         conn.commit()
         return jsonify({'success': True, 'order_id': order_id}), 201
+    except DB_TIMEOUT_ERRORS as e:
+        if conn:
+            conn.rollback()
+        return timeout_response(e)
     except Exception as e:
         if conn:
             conn.rollback()
@@ -5,11 +5,11 @@ import logging
 from urllib.parse import urlencode
 import hashlib
 import uuid
-import psycopg2
 from psycopg2 import sql
 from psycopg2.extras import Json
 from dotenv import load_dotenv
 import json
+from db import get_connection
 
 load_dotenv()
 
@@ -110,15 +110,7 @@ def update_order_payment_status(m_payment_id, success=True):
         return False
 
     try:
-        conn = psycopg2.connect(
-            host=os.environ.get('DB_HOST'),
-            database=os.environ.get('DB_NAME'),
-            user=os.environ.get('DB_USER'),
-            password=os.environ.get('DB_PASSWORD'),
-            port=os.environ.get('DB_PORT', 5432),
-            sslmode=os.getenv('DB_SSLMODE', 'require')
-        )
-        cur = conn.cursor()
+        conn, cur = db_connect()
         # Only mark as paid when success is True
         cur.execute(
             "UPDATE orders SET payment_status = %s WHERE id = %s RETURNING id",
@@ -141,15 +133,8 @@ def update_order_payment_status(m_payment_id, success=True):
 
 # --- New DB helpers (added) ---
 def db_connect():
-    """Return (conn, cur) connected to Postgres using environment variables."""
-    conn = psycopg2.connect(
-        host=os.environ.get('DB_HOST'),
-        database=os.environ.get('DB_NAME'),
-        user=os.environ.get('DB_USER'),
-        password=os.environ.get('DB_PASSWORD'),
-        port=os.environ.get('DB_PORT', 5432),
-        sslmode=os.getenv('DB_SSLMODE', 'require')
-    )
+    """Return (conn, cur) borrowed from the shared connection pool."""
+    conn = get_connection()
     cur = conn.cursor()
     return conn, cur
 
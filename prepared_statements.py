@@ -0,0 +1,94 @@
+"""
+Per-connection registry of server-side prepared statements.
+
+Hot queries are registered once at import time with their normal psycopg2
+SQL (%s placeholders). execute() PREPAREs a statement the first time it runs
+on a given pooled connection and afterwards only sends EXECUTE, so Postgres
+skips parsing and, once it settles on a generic plan, planning.
+
+Cursors that don't belong to a pooled db.PoolConnection (test doubles, ad-hoc
+connections) simply run the plain SQL, as does every cursor in transaction
+pooling mode (db.transaction_pooling()), where the next transaction may land
+on a server session that never saw the PREPARE.
+"""
+import re
+
+from psycopg2 import errors
+
+import db
+
+_statements = {}
+
+_PLACEHOLDER = re.compile(r'%%|%s')
+
+
+def register(name, sql):
+    """Register `sql` under `name` and return the name. Names must be valid SQL identifiers."""
+    if not re.fullmatch(r'[a-z_][a-z0-9_]*', name):
+        raise ValueError(f"Invalid prepared statement name: {name!r}")
+    existing = _statements.get(name)
+    if existing is not None and existing != sql:
+        raise ValueError(f"Prepared statement {name!r} is already registered with different SQL")
+    _statements[name] = sql
+    return name
+
+
+def registered():
+    """Return a copy of the registry as {name: sql}."""
+    return dict(_statements)
+
+
+def to_positional(sql):
+    """Convert psycopg2 %s placeholders to $1..$n. Returns (sql, parameter count)."""
+    count = 0
+
+    def replace(match):
+        nonlocal count
+        if match.group(0) == '%%':
+            return '%'
+        count += 1
+        return f'${count}'
+
+    return _PLACEHOLDER.sub(replace, sql), count
+
+
+def _registry_for(cur):
+    """Per-connection state, or None when `cur` isn't on a pooled connection."""
+    conn = getattr(cur, 'connection', None)
+    if not isinstance(conn, db.PoolConnection) or db.transaction_pooling():
+        return None
+    if conn.prepared_statements is None:
+        conn.prepared_statements = set()
+        conn.stale_statements = set()
+    return conn
+
+
+def execute(cur, name, params=()):
+    """Execute the registered statement `name` on `cur` with `params`."""
+    sql = _statements[name]
+    conn = _registry_for(cur)
+    if conn is None:
+        cur.execute(sql, params)
+        return
+
+    positional_sql, count = to_positional(sql)
+    if name not in conn.prepared_statements:
+        if name in conn.stale_statements:
+            cur.execute(f"DEALLOCATE {name}")
+            conn.stale_statements.discard(name)
+        cur.execute(f"PREPARE {name} AS {positional_sql}")
+        conn.prepared_statements.add(name)
+
+    placeholders = ', '.join(['%s'] * count)
+    try:
+        cur.execute(f"EXECUTE {name} ({placeholders})" if count else f"EXECUTE {name}", params)
+    except errors.InvalidSqlStatementName:
+        # Gone from the session (e.g. DISCARD ALL); PREPARE again next time
+        conn.prepared_statements.discard(name)
+        raise
+    except errors.FeatureNotSupported:
+        # "cached plan must not change result type" after a schema change:
+        # drop and re-prepare once the caller's transaction has been rolled back
+        conn.prepared_statements.discard(name)
+        conn.stale_statements.add(name)
+        raise
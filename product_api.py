@@ -1,6 +1,12 @@
 import os
-from flask import Blueprint, jsonify
-import psycopg2
+import json
+import base64
+import binascii
+from flask import Blueprint, jsonify, request
+from db import get_connection, CATALOG, DB_TIMEOUT_ERRORS, timeout_response
+from catalog_cache import catalog_cache, CachedBody, PRODUCT_LISTING
+from fieldsets import parse_fields
+from product_index import prefix_index
 from psycopg2.extras import RealDictCursor
 import socket
 from dotenv import load_dotenv
@@ -11,71 +17,210 @@ load_dotenv()
 
 product_bp = Blueprint('product', __name__)
 
+PRODUCTS_CACHE_KEY = 'products'
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# Query parameter -> (column, parser)
+BOOLEAN_VALUES = {'true': True, '1': True, 'false': False, '0': False}
+PRODUCT_FILTERS = {
+    'type': ('pl.type', str),
+    'material': ('pl.material', str),
+    'food_safe': ('pl.food_safe', lambda v: BOOLEAN_VALUES[v.lower()]),
+    'recyclable': ('pl.recyclable', lambda v: BOOLEAN_VALUES[v.lower()]),
+    'heat_resistant': ('pl.heat_resistant', lambda v: BOOLEAN_VALUES[v.lower()]),
+    'eco_friendly': ('pl.eco_friendly', lambda v: BOOLEAN_VALUES[v.lower()]),
+}
+
+# Response key -> column of the product_listing view (see product_listing.py);
+# ?fields= picks a subset (keys match Products.js)
+LISTING_FIELDS = {
+    'id': 'pl.id',
+    'title': 'pl.name',
+    'official_name': 'pl.official_name',
+    'price': 'pl.price',
+    'description': 'pl.description',
+    'image': 'pl.primary_image',
+    'code': 'pl.product_code',
+    'stock': 'pl.stock',
+    'type': 'pl.type',
+    'attributes': 'pl.attributes',
+    'average_rating': 'pl.average_rating',
+    'review_count': 'pl.review_count',
+}
+# Returned when ?fields= isn't given; the rest have to be asked for
+DEFAULT_LISTING_FIELDS = ('id', 'title', 'official_name', 'price', 'description', 'image', 'code', 'stock', 'type')
+
 def get_db_connection():
-    """Create and return a database connection using environment variables"""
-    conn = psycopg2.connect(
-        host=os.environ.get('DB_HOST'),
-        database=os.environ.get('DB_NAME'),
-        user=os.environ.get('DB_USER'),
-        password=os.environ.get('DB_PASSWORD'),
-        port=os.environ.get('DB_PORT', 5432),
-        sslmode=os.getenv('DB_SSLMODE', 'require')
-    )
+    """Borrow a read-only connection (replica when healthy); close() returns it."""
+    conn = get_connection(readonly=True, route_class=CATALOG)
     return conn
 
 
+def encode_cursor(*keys):
+    """Opaque cursor pointing just past the row with sort keys `keys`, e.g. (name, id) in the listing order."""
+    raw = json.dumps(list(keys), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, types=(str, int)):
+    """
+    Inverse of encode_cursor(), expecting one key of each of `types`; raises
+    ValueError for anything it didn't produce.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        keys = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(keys, list) or len(keys) != len(types):
+        raise ValueError('Invalid cursor')
+    keys = [float(key) if kind is float and type(key) is int else key for key, kind in zip(keys, types)]
+    if not all(isinstance(key, kind) and not isinstance(key, bool) for key, kind in zip(keys, types)):
+        raise ValueError('Invalid cursor')
+    return tuple(keys)
+
+
+def parse_listing_args(args):
+    """
+    Validate the listing's query parameters.
+
+    Returns None when none were given (the full, unpaginated listing), else
+    (filters, limit, after) where filters maps column -> value and after is
+    the decoded cursor or None. Raises ValueError for invalid input.
+    """
+    if not any(name in args for name in (*PRODUCT_FILTERS, 'limit', 'cursor')):
+        return None
+
+    cursor = args.get('cursor')
+    after = decode_cursor(cursor) if cursor else None
+    return parse_filters(args), parse_limit(args), after
+
+
+def parse_filters(args):
+    """column -> value for the PRODUCT_FILTERS given in `args`. Raises ValueError."""
+    filters = {}
+    for name, (column, parse) in PRODUCT_FILTERS.items():
+        value = args.get(name)
+        if value is None or value == '':
+            continue
+        try:
+            filters[column] = parse(value)
+        except KeyError:
+            raise ValueError(f"'{name}' must be true or false")
+    return filters
+
+
+def parse_limit(args):
+    """?limit=, DEFAULT_PAGE_SIZE when absent. Raises ValueError."""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("'limit' must be an integer")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"'limit' must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+def listing_columns(fields):
+    """Select list for `fields`, read from the product_listing view (alias pl)."""
+    return [f'{LISTING_FIELDS[name]} AS "{name}"' for name in fields]
+
+
+def listing_query(fields, paginated=False):
+    """SELECT ... FROM the product_listing view for `fields`."""
+    columns = listing_columns(fields)
+    if paginated:
+        # The keyset, whether or not the client asked for it
+        columns += ['pl.name AS "_sort_name"', 'pl.id AS "_sort_id"']
+    return f"SELECT {', '.join(columns)} FROM product_listing pl"
+
+
+def serialize_product(row):
+    return {key: value for key, value in row.items() if not key.startswith('_')}
+
+
+def fetch_page(cursor, fields, filters, limit, after):
+    """One page of the listing in (name, id) order, plus the cursor for the next one."""
+    conditions = [f"{column} = %s" for column in filters]
+    params = list(filters.values())
+    if after is not None:
+        # Row comparison lets the (name, id) index seek straight to the page
+        conditions.append("(pl.name, pl.id) > (%s, %s)")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    cursor.execute(f"{listing_query(fields, paginated=True)} {where} ORDER BY pl.name, pl.id LIMIT %s",
+                   (*params, limit + 1))
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['_sort_name'], rows[-1]['_sort_id'])
+    return rows, next_cursor
+
+
 @product_bp.route('/products', methods=['GET'])
 def get_products():
     """
-    Fetch all products with their primary images.
-    Returns a list of products with basic info and primary image URL.
+    Fetch products with their primary images.
+
+    Without query parameters, returns the whole catalog as a list ordered by
+    name. With any of limit, cursor or the PRODUCT_FILTERS parameters, returns
+    one page: {products, next_cursor}, where next_cursor (null on the last
+    page) is passed back as ?cursor= to get the following page. ?fields= (a
+    comma-separated subset of LISTING_FIELDS) picks the keys of every product;
+    without it they are DEFAULT_LISTING_FIELDS.
+
+    Reads the product_listing materialized view, so the data is as of its last
+    refresh (see product_listing.py).
+
+    Served from the catalog cache when it holds a fresh copy; carries an
+    ETag, and If-None-Match gets a 304.
     """
+    try:
+        listing = parse_listing_args(request.args)
+        fields = parse_fields(request.args.get('fields'), LISTING_FIELDS, DEFAULT_LISTING_FIELDS)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    projection = None if tuple(fields) == DEFAULT_LISTING_FIELDS else tuple(fields)
+    if listing is None:
+        cache_key = PRODUCTS_CACHE_KEY if projection is None else (PRODUCTS_CACHE_KEY, projection)
+    else:
+        filters, limit, after = listing
+        cache_key = (PRODUCTS_CACHE_KEY, projection, tuple(sorted(filters.items())), limit, after)
+
+    cached = catalog_cache.get(cache_key)
+    if cached is not None:
+        return cached.response()
+
+    generation = catalog_cache.generation()
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(cursor_factory=RealDictCursor)
 
-        query = """
-        SELECT 
-            p.id, 
-            p.product_code, 
-            p.name, 
-            p.official_name,
-            p.type, 
-            p.description,
-            p.price,
-            i.quantity as stock,
-            (
-                SELECT image_url 
-                FROM product_images 
-                WHERE product_id = p.id AND is_primary = TRUE 
-                LIMIT 1
-            ) as primary_image
-        FROM 
-            products p
-        LEFT JOIN 
-            inventory i ON p.id = i.product_id
-        ORDER BY 
-            p.name
-        """
-        cursor.execute(query)
-        products = cursor.fetchall()
-        
-        # Return products as a list of JSON objects with keys matching Products.js
-        return jsonify([
-            {
-                'id': p['id'],
-                'title': p['name'],
-                'official_name': p.get('official_name', ''),
-                'price': p.get('price', ''),
-                'description': p['description'],
-                'image': p.get('primary_image', ''),
-                'code': p['product_code'],
-                'stock': p.get('stock', 0),
-                'type': p['type']
+        if listing is None:
+            cursor.execute(f"{listing_query(fields)} ORDER BY pl.name, pl.id")
+            body = [serialize_product(p) for p in cursor.fetchall()]
+        else:
+            products, next_cursor = fetch_page(cursor, fields, filters, limit, after)
+            body = {
+                'success': True,
+                'products': [serialize_product(p) for p in products],
+                'next_cursor': next_cursor
             }
-            for p in products
-        ])
 
+        cached = CachedBody(jsonify(body).get_data())
+        catalog_cache.set(cache_key, cached,
+                          tags=(PRODUCT_LISTING,), generation=generation)
+        return cached.response()
+
+    except DB_TIMEOUT_ERRORS as e:
+        return timeout_response(e)
     except Exception as e:
         print(f"Error fetching products: {e}")
         return jsonify({
@@ -83,4 +228,402 @@ def get_products():
             'message': 'Failed to fetch products',
             'error': str(e)
         }), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+MAX_SEARCH_LENGTH = 200
+
+# The full-text document of a product; must match the expression of the
+# idx_products_search_document index (migrations/0007_product_search.sql)
+SEARCH_DOCUMENT = """(
+        setweight(to_tsvector('simple', coalesce(p.product_code, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(p.name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(p.official_name, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(p.description, '')), 'C')
+    )"""
+
+# How /products/search matches: (cursor tag, rank expression, match condition).
+# Full-text first; when that finds nothing, trigram similarity on name and code
+# so typos still find something. Both are served by GIN indexes on products.
+SEARCH_MODES = {
+    'fulltext': (
+        f"ts_rank({SEARCH_DOCUMENT}, websearch_to_tsquery('english', %(q)s))::float8",
+        f"{SEARCH_DOCUMENT} @@ websearch_to_tsquery('english', %(q)s)",
+    ),
+    'similar': (
+        "GREATEST(similarity(p.name, %(q)s), similarity(p.product_code, %(q)s))::float8",
+        "(p.name %% %(q)s OR p.product_code %% %(q)s)",
+    ),
+}
+
+
+def parse_search_args(args):
+    """(q, filters, limit, after) for /products/search; after is (mode, rank, id) or None. Raises ValueError."""
+    q = (args.get('q') or '').strip()
+    if not q:
+        raise ValueError("'q' is required")
+    if len(q) > MAX_SEARCH_LENGTH:
+        raise ValueError(f"'q' must be at most {MAX_SEARCH_LENGTH} characters")
+    cursor = args.get('cursor')
+    after = decode_cursor(cursor, types=(str, float, int)) if cursor else None
+    if after is not None and after[0] not in SEARCH_MODES:
+        raise ValueError('Invalid cursor')
+    return q, parse_filters(args), parse_limit(args), after
+
+
+def fetch_search_page(cursor, mode, q, fields, filters, limit, after):
+    """One page of `mode` matches for `q`, best first, plus the cursor for the next one."""
+    rank, match = SEARCH_MODES[mode]
+    params = {'q': q, 'limit': limit + 1}
+    conditions = [match]
+    for i, (column, value) in enumerate(filters.items()):
+        conditions.append(f"{column} = %(filter_{i})s")
+        params[f'filter_{i}'] = value
+    if after is not None:
+        conditions.append(f"({rank}, p.id) < (%(after_rank)s, %(after_id)s)")
+        params['after_rank'], params['after_id'] = after[1:]
+    cursor.execute(f"""
+        SELECT {', '.join(listing_columns(fields))}, {rank} AS "_rank", p.id AS "_sort_id"
+        FROM products p
+        JOIN product_listing pl ON pl.id = p.id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY "_rank" DESC, p.id DESC
+        LIMIT %(limit)s
+    """, params)
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(mode, rows[-1]['_rank'], rows[-1]['_sort_id'])
+    return rows, next_cursor
+
 
+@product_bp.route('/products/search', methods=['GET'])
+def search_products():
+    """
+    Ranked product search: /products/search?q=round tray.
+
+    Matches q against product code, name, official name and description
+    (SEARCH_DOCUMENT) and orders by ts_rank. When nothing matches, falls
+    back to trigram similarity on name and code, so misspellings still find
+    products; match says which was used.
+
+    Takes the same limit, PRODUCT_FILTERS and fields parameters as /products
+    and returns the same item shape: {success, match, products, next_cursor}.
+    """
+    try:
+        q, filters, limit, after = parse_search_args(request.args)
+        fields = parse_fields(request.args.get('fields'), LISTING_FIELDS, DEFAULT_LISTING_FIELDS)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        mode = after[0] if after else 'fulltext'
+        products, next_cursor = fetch_search_page(cursor, mode, q, fields, filters, limit, after)
+        if not products and after is None:
+            mode = 'similar'
+            products, next_cursor = fetch_search_page(cursor, mode, q, fields, filters, limit, None)
+
+        return jsonify({
+            'success': True,
+            'match': mode,
+            'products': [serialize_product(p) for p in products],
+            'next_cursor': next_cursor
+        })
+    except DB_TIMEOUT_ERRORS as e:
+        return timeout_response(e)
+    except Exception as e:
+        print(f"Error searching products: {e}")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to search products',
+            'error': str(e)
+        }), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+DEFAULT_SUGGESTIONS = 8
+MAX_SUGGESTIONS = 20
+MAX_PREFIX_LENGTH = 100
+
+
+@product_bp.route('/products/suggest', methods=['GET'])
+def suggest_products():
+    """
+    Search-as-you-type: /products/suggest?prefix=rou&limit=8 (limit at most
+    MAX_SUGGESTIONS).
+
+    Returns {success, suggestions: [{id, name, code}]}: products whose code,
+    name or a word of the name starts with prefix, name/code matches first.
+    Served from this worker's product_index.prefix_index, not Postgres.
+    """
+    prefix = (request.args.get('prefix') or '').strip()
+    if not prefix:
+        return jsonify({'success': False, 'message': "'prefix' is required"}), 400
+    if len(prefix) > MAX_PREFIX_LENGTH:
+        return jsonify({'success': False, 'message': f"'prefix' must be at most {MAX_PREFIX_LENGTH} characters"}), 400
+    try:
+        limit = int(request.args.get('limit', DEFAULT_SUGGESTIONS))
+    except ValueError:
+        return jsonify({'success': False, 'message': "'limit' must be an integer"}), 400
+    if not 1 <= limit <= MAX_SUGGESTIONS:
+        return jsonify({'success': False, 'message': f"'limit' must be between 1 and {MAX_SUGGESTIONS}"}), 400
+
+    suggestions = prefix_index.suggest(prefix, limit)
+    if suggestions is None:
+        return jsonify({'success': False, 'message': 'Suggestions are temporarily unavailable'}), 503
+    return jsonify({'success': True, 'suggestions': suggestions})
+
+
+FACETS_CACHE_KEY = 'facets'
+
+# Counted by /products/facets: facet -> column of the product_listing view
+FACETS = {
+    'type': 'type',
+    'material': 'material',
+    'food_safe': 'food_safe',
+    'recyclable': 'recyclable',
+    'heat_resistant': 'heat_resistant',
+    'eco_friendly': 'eco_friendly',
+}
+# Lower edges of the price buckets; the last bucket is open-ended
+PRICE_BUCKETS = (0, 250, 500, 1000, 2500, 5000)
+
+
+def facets_query(filters):
+    """
+    Every facet's counts for the products matching `filters` (column -> value,
+    as from parse_filters), in one scan: one grouping set per facet plus the
+    grand total. Takes (PRICE_BUCKETS, *filter values) as parameters.
+    """
+    grouped = [*FACETS.values(), 'price_bucket']
+    where = f"WHERE {' AND '.join(f'{column} = %s' for column in filters)}" if filters else ""
+    return f"""
+        SELECT {', '.join(grouped)}, GROUPING({', '.join(grouped)}) AS grouping_set, COUNT(*) AS count
+        FROM (
+            SELECT {', '.join(f'pl.{column}' for column in FACETS.values())},
+                   width_bucket(pl.price, %s::numeric[]) AS price_bucket
+            FROM product_listing pl
+            {where}
+        ) f
+        GROUP BY GROUPING SETS ({', '.join(f'({column})' for column in grouped)}, ())
+    """
+
+
+def build_facets(rows):
+    """{total, facets} from the facets_query() rows."""
+    names = [*FACETS, 'price']
+    columns = [*FACETS.values(), 'price_bucket']
+    facets = {name: [] for name in names}
+    total = 0
+    for row in rows:
+        # GROUPING() sets the bit of every column the row is *not* grouped by,
+        # first column in the highest bit
+        grouped_by = [i for i in range(len(names)) if not row['grouping_set'] & (1 << (len(names) - 1 - i))]
+        if not grouped_by:
+            total = row['count']
+            continue
+        i = grouped_by[0]
+        value = row[columns[i]]
+        if value is None:
+            continue
+        if names[i] == 'price':
+            facets['price'].append({
+                'min': PRICE_BUCKETS[value - 1] if value > 0 else None,
+                'max': PRICE_BUCKETS[value] if value < len(PRICE_BUCKETS) else None,
+                'count': row['count'],
+                '_bucket': value,
+            })
+        else:
+            facets[names[i]].append({'value': value, 'count': row['count']})
+
+    for name in FACETS:
+        facets[name].sort(key=lambda entry: (-entry['count'], str(entry['value'])))
+    facets['price'].sort(key=lambda entry: entry.pop('_bucket'))
+    return {'success': True, 'total': total, 'facets': facets}
+
+
+@product_bp.route('/products/facets', methods=['GET'])
+def get_product_facets():
+    """
+    Counts for the shop sidebar: how many of the products matching the
+    PRODUCT_FILTERS given (same parameters as /products) have each type,
+    material and flag value, and fall in each PRICE_BUCKETS range.
+
+    Returns {success, total, facets: {type: [{value, count}], ...,
+    price: [{min, max, count}]}}, computed in a single grouped query and
+    cached like the listing.
+    """
+    try:
+        filters = parse_filters(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    cache_key = (FACETS_CACHE_KEY, tuple(sorted(filters.items())))
+    cached = catalog_cache.get(cache_key)
+    if cached is not None:
+        return cached.response()
+
+    generation = catalog_cache.generation()
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(facets_query(filters), (list(PRICE_BUCKETS), *filters.values()))
+        cached = CachedBody(jsonify(build_facets(cursor.fetchall())).get_data())
+        catalog_cache.set(cache_key, cached, tags=(PRODUCT_LISTING,), generation=generation)
+        return cached.response()
+    except DB_TIMEOUT_ERRORS as e:
+        return timeout_response(e)
+    except Exception as e:
+        print(f"Error fetching product facets: {e}")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to fetch product facets',
+            'error': str(e)
+        }), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+# /products/shapes dimensions: parameter -> aluminum_shapes column
+SHAPE_DIMENSIONS = {'diameter': 'a.diameter_mm', 'height': 'a.height_mm'}
+
+
+def parse_shape_args(args):
+    """
+    Validate /products/shapes parameters. Returns (min_volume, max_volume,
+    targets, tolerance, nearest, limit), where targets maps the
+    SHAPE_DIMENSIONS column of each given dimension to its value. Raises
+    ValueError.
+    """
+    def non_negative_int(name, default=None):
+        value = args.get(name)
+        if value is None or value == '':
+            return default
+        try:
+            number = int(value)
+        except ValueError:
+            raise ValueError(f"'{name}' must be an integer")
+        if number < 0:
+            raise ValueError(f"'{name}' must not be negative")
+        return number
+
+    min_volume = non_negative_int('min_volume')
+    max_volume = non_negative_int('max_volume')
+    if min_volume is not None and max_volume is not None and min_volume > max_volume:
+        raise ValueError("'min_volume' must not exceed 'max_volume'")
+    targets = {}
+    for name, column in SHAPE_DIMENSIONS.items():
+        value = non_negative_int(name)
+        if value is not None:
+            targets[column] = value
+    tolerance = non_negative_int('tolerance', 0)
+
+    try:
+        nearest = BOOLEAN_VALUES[args.get('nearest', 'false').lower()]
+    except KeyError:
+        raise ValueError("'nearest' must be true or false")
+    if nearest and not targets:
+        raise ValueError("'nearest' needs 'diameter' and/or 'height'")
+    if nearest and 0 in targets.values():
+        raise ValueError("'diameter' and 'height' must be positive with 'nearest'")
+    return min_volume, max_volume, targets, tolerance, nearest, parse_limit(args)
+
+
+@product_bp.route('/products/shapes', methods=['GET'])
+def search_shapes():
+    """
+    Find aluminum shapes by capacity and footprint:
+    /products/shapes?min_volume=&max_volume=&diameter=&height=
+
+    min_volume/max_volume bound volume_cm3. diameter and height (mm) match
+    within ?tolerance= mm (default 0), smallest volume first. With
+    ?nearest=true they are targets instead: every shape within the volume
+    range is ranked by its relative distance from them, closest first.
+
+    Items have the /products shape (and accept ?fields=) plus dimensions, and
+    distance in nearest mode: {success, shapes}. At most ?limit= are returned.
+    """
+    try:
+        min_volume, max_volume, targets, tolerance, nearest, limit = parse_shape_args(request.args)
+        fields = parse_fields(request.args.get('fields'), LISTING_FIELDS, DEFAULT_LISTING_FIELDS)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    conditions = []
+    params = []
+    if min_volume is not None:
+        conditions.append("a.volume_cm3 >= %s")
+        params.append(min_volume)
+    if max_volume is not None:
+        conditions.append("a.volume_cm3 <= %s")
+        params.append(max_volume)
+
+    columns = [*listing_columns(fields), 'a.diameter_mm', 'a.height_mm', 'a.volume_cm3']
+    if nearest:
+        # Sum of each dimension's relative miss, so 10mm counts for more on a small tray
+        distance = ' + '.join(f"ABS({column} - %s)::float8 / %s" for column in targets)
+        columns.append(f'{distance} AS "distance"')
+        conditions += [f"{column} IS NOT NULL" for column in targets]
+        select_params = [value for target in targets.values() for value in (target, target)]
+        order = '"distance", a.product_id'
+    else:
+        for column, target in targets.items():
+            conditions.append(f"{column} BETWEEN %s AND %s")
+            params += [target - tolerance, target + tolerance]
+        select_params = []
+        order = 'a.volume_cm3 NULLS LAST, a.product_id'
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(f"""
+            SELECT {', '.join(columns)}
+            FROM aluminum_shapes a
+            JOIN product_listing pl ON pl.id = a.product_id
+            {where}
+            ORDER BY {order}
+            LIMIT %s
+        """, (*select_params, *params, limit))
+
+        shapes = []
+        for row in cursor.fetchall():
+            shape = serialize_product(row)
+            shape['dimensions'] = {key: shape.pop(key) for key in ('diameter_mm', 'height_mm', 'volume_cm3')}
+            shapes.append(shape)
+        return jsonify({'success': True, 'shapes': shapes})
+    except DB_TIMEOUT_ERRORS as e:
+        return timeout_response(e)
+    except Exception as e:
+        print(f"Error searching shapes: {e}")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to search shapes',
+            'error': str(e)
+        }), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
@@ -1,6 +1,11 @@
 import os
-from flask import Blueprint, jsonify
-import psycopg2
+from datetime import datetime
+from flask import Blueprint, jsonify, request
+from db import get_connection, CATALOG, DB_TIMEOUT_ERRORS, timeout_response
+import prepared_statements
+from fieldsets import parse_fields
+from product_index import code_index
+from product_api import encode_cursor, decode_cursor
 from psycopg2.extras import RealDictCursor
 import socket
 from dotenv import load_dotenv
@@ -12,94 +17,178 @@ load_dotenv()
 
 product_detail_bp = Blueprint('product_detail', __name__)
 
+# ?fields= accepts product columns and response sections
+PRODUCT_COLUMNS = (
+    'id', 'product_code', 'name', 'official_name', 'type', 'material', 'food_safe', 'recyclable',
+    'heat_resistant', 'eco_friendly', 'rating', 'price', 'description', 'created_at',
+)
+DETAIL_SECTIONS = ('type_details', 'images', 'inventory', 'reviews', 'average_rating', 'total_reviews')
+DETAIL_FIELDS = PRODUCT_COLUMNS + DETAIL_SECTIONS
+
+# Reviews embedded in the detail document; the rest are paged through
+# /product/<id>/reviews
+DETAIL_REVIEWS = 10
+DEFAULT_REVIEWS_PAGE_SIZE = 10
+MAX_REVIEWS_PAGE_SIZE = 50
+
+# One LATERAL subquery per part of the document, so the whole detail page is a
+# single round trip: (response sections, select list, join). The review summary
+# comes from the running aggregates in product_review_stats.
+DETAIL_PARTS = [
+    (('type_details',), "td.value AS _type_details", """
+    LEFT JOIN LATERAL (
+        SELECT COALESCE(CASE p.type
+            WHEN 'aluminum_shape' THEN (SELECT to_jsonb(t) FROM aluminum_shapes t WHERE t.product_id = p.id)
+            WHEN 'cardboard_lid' THEN (SELECT to_jsonb(t) FROM cardboard_lids t WHERE t.product_id = p.id)
+            WHEN 'pack' THEN (SELECT to_jsonb(t) FROM product_packs t WHERE t.product_id = p.id)
+            WHEN 'complement' THEN (SELECT to_jsonb(t) FROM complements t WHERE t.product_id = p.id)
+        END, '{}'::jsonb) AS value
+    ) td ON TRUE"""),
+    (('images',), "imgs.value AS _images", """
+    LEFT JOIN LATERAL (
+        SELECT COALESCE(json_agg(json_build_object(
+                   'id', i.id, 'image_url', i.image_url, 'is_primary', i.is_primary
+               ) ORDER BY i.is_primary DESC, i.id ASC), '[]'::json) AS value
+        FROM product_images i
+        WHERE i.product_id = p.id
+    ) imgs ON TRUE"""),
+    (('inventory',), "inv.value AS _inventory", """
+    LEFT JOIN LATERAL (
+        SELECT COALESCE((SELECT quantity FROM inventory WHERE product_id = p.id), 0) AS value
+    ) inv ON TRUE"""),
+    # One more than DETAIL_REVIEWS, to tell whether there is a next page
+    (('reviews',), "rv.value AS _reviews", f"""
+    LEFT JOIN LATERAL (
+        SELECT COALESCE(json_agg(r ORDER BY r.created_at DESC, r.id DESC), '[]'::json) AS value
+        FROM (
+            SELECT id, rating, review, reviewer_name, created_at
+            FROM product_reviews
+            WHERE product_id = p.id
+            ORDER BY created_at DESC, id DESC
+            LIMIT {DETAIL_REVIEWS + 1}
+        ) r
+    ) rv ON TRUE"""),
+    (('average_rating', 'total_reviews'),
+     "ROUND(rs.rating_sum / NULLIF(rs.rated_count, 0), 2) AS _average_rating, "
+     "COALESCE(rs.review_count, 0) AS _total_reviews", """
+    LEFT JOIN product_review_stats rs ON rs.product_id = p.id"""),
+]
+
+
+def detail_query(fields, where):
+    """The detail document for `fields` as one statement, for the products matching `where`."""
+    wanted = set(fields)
+    # Named rather than p.*: a prepared p.* fails with "cached plan must not
+    # change result type" on every pooled session once products gains a column
+    columns = [f'p.{c}' for c in PRODUCT_COLUMNS if c in wanted or c == 'id']
+    joins = []
+    for sections, select, join in DETAIL_PARTS:
+        if wanted.intersection(sections):
+            columns.append(select)
+            joins.append(join)
+    return f"SELECT {', '.join(columns)} FROM products p {''.join(joins)} WHERE {where}"
+
+
+PRODUCT_DETAIL_STMT = prepared_statements.register(
+    'product_detail_by_id', detail_query(DETAIL_FIELDS, 'p.id = %s'))
+PRODUCT_DETAIL_BY_CODE_STMT = prepared_statements.register(
+    'product_detail_by_code', detail_query(DETAIL_FIELDS, 'p.product_code = %s'))
+
+MAX_BATCH_SIZE = 50
+
+
 def get_db_connection():
-    """Create and return a database connection using environment variables"""
-    conn = psycopg2.connect(
-        host=os.environ.get('DB_HOST'),
-        database=os.environ.get('DB_NAME'),
-        user=os.environ.get('DB_USER'),
-        password=os.environ.get('DB_PASSWORD'),
-        port=os.environ.get('DB_PORT', 5432),
-        sslmode=os.getenv('DB_SSLMODE', 'require')
-    )
+    """Borrow a read-only connection (replica when healthy); close() returns it."""
+    conn = get_connection(readonly=True, route_class=CATALOG)
     return conn
 
-@product_detail_bp.route('/product/<int:product_id>', methods=['GET'])
-def get_product_detail(product_id):
+
+def build_detail_response(row, fields):
+    """Split the single detail row back into the response document."""
+    product = {key: value for key, value in row.items() if not key.startswith('_')}
+    response = {'success': True, 'product': product}
+    for section in DETAIL_SECTIONS:
+        if section in fields:
+            response[section] = row[f'_{section}']
+
+    if 'reviews' in response:
+        # json_agg renders timestamps as ISO strings; restore datetimes so the
+        # reviews serialize exactly as they did when read as plain rows
+        for review in response['reviews']:
+            if isinstance(review.get('created_at'), str):
+                review['created_at'] = datetime.fromisoformat(review['created_at'])
+        response['reviews'], response['reviews_next_cursor'] = review_page(response['reviews'], DETAIL_REVIEWS)
+    if 'average_rating' in response and not response['average_rating']:
+        response['average_rating'] = 0
+    return response
+
+
+def review_page(reviews, limit):
+    """(the first `limit` of `reviews`, cursor for the page after them or None)."""
+    if len(reviews) <= limit:
+        return reviews, None
+    reviews = reviews[:limit]
+    last = reviews[-1]
+    return reviews, encode_cursor(last['created_at'].isoformat(), last['id'])
+
+
+def decode_review_cursor(cursor):
+    """(created_at, id) from a review cursor; raises ValueError if it isn't one."""
+    created_at, review_id = decode_cursor(cursor)
+    try:
+        return datetime.fromisoformat(created_at), review_id
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+
+def fetch_product_detail(key_column, value, statement, fields):
     """
-    Fetch detailed information about a specific product,
-    including type-specific details, all images, and inventory.
+    Detail response for the product whose `key_column` equals `value`, or None.
+
+    `fields` (parsed from ?fields=) limits the product to the listed
+    PRODUCT_COLUMNS (id is always included) and the response to the listed
+    DETAIL_SECTIONS; the parts that aren't asked for are left out of the query.
     """
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(cursor_factory=RealDictCursor)
-        # Get basic product info
-        cursor.execute("SELECT * FROM products WHERE id = %s", (product_id,))
-        product = cursor.fetchone()
-        if not product:
+        if len(fields) == len(DETAIL_FIELDS):
+            prepared_statements.execute(cursor, statement, (value,))
+        else:
+            cursor.execute(detail_query(fields, f"{key_column} = %s"), (value,))
+        row = cursor.fetchone()
+        return build_detail_response(row, fields) if row else None
+    finally:
+        if cursor:
             cursor.close()
+        if conn:
             conn.close()
-            return jsonify({'success': False, 'message': f'Product with ID {product_id} not found'}), 404
 
-        # Get product type-specific details
-        product_type = product['type']
-        type_details = {}
-        if product_type == 'aluminum_shape':
-            cursor.execute("SELECT * FROM aluminum_shapes WHERE product_id = %s", (product_id,))
-            type_details = cursor.fetchone() or {}
-        elif product_type == 'cardboard_lid':
-            cursor.execute("SELECT * FROM cardboard_lids WHERE product_id = %s", (product_id,))
-            type_details = cursor.fetchone() or {}
-        elif product_type == 'pack':
-            cursor.execute("SELECT * FROM product_packs WHERE product_id = %s", (product_id,))
-            type_details = cursor.fetchone() or {}
-        elif product_type == 'complement':
-            cursor.execute("SELECT * FROM complements WHERE product_id = %s", (product_id,))
-            type_details = cursor.fetchone() or {}
-
-        # Get all product images
-        cursor.execute(
-            "SELECT id, image_url, is_primary FROM product_images WHERE product_id = %s ORDER BY is_primary DESC, id ASC",
-            (product_id,))
-        images = cursor.fetchall()
-
-        # Get inventory information
-        cursor.execute("SELECT quantity FROM inventory WHERE product_id = %s", (product_id,))
-        inventory = cursor.fetchone()
-
-        # Get reviews (latest 10)
-        cursor.execute("""
-            SELECT rating, review, reviewer_name, created_at
-            FROM product_reviews
-            WHERE product_id = %s
-            ORDER BY created_at DESC
-            LIMIT 10;
-            """, (product_id,))
-        reviews = cursor.fetchall()
-
-        # Get average rating
-        cursor.execute("""
-            SELECT ROUND(AVG(rating), 2) AS avg_rating, COUNT(*) AS total_reviews
-            FROM product_reviews
-            WHERE product_id = %s;
-            """, (product_id,))
-        rating_stats = cursor.fetchone()
-
-
-        cursor.close()
-        conn.close()
-
-        response = {
-            'success': True,
-            'product': product,
-            'type_details': type_details,
-            'images': images,
-            'inventory': inventory['quantity'] if inventory else 0,
-            'reviews': reviews,
-            'average_rating': rating_stats['avg_rating'] if rating_stats['avg_rating'] else 0,
-            'total_reviews': rating_stats['total_reviews']
-        }
+
+@product_detail_bp.route('/product/<int:product_id>', methods=['GET'])
+def get_product_detail(product_id):
+    """
+    Fetch detailed information about a specific product,
+    including type-specific details, all images, and inventory.
+    Accepts ?fields= (see fetch_product_detail).
+
+    Only the DETAIL_REVIEWS most recent reviews are included; when there are
+    more, reviews_next_cursor continues from there on /product/<id>/reviews.
+    """
+    try:
+        fields = parse_fields(request.args.get('fields'), DETAIL_FIELDS)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    try:
+        response = fetch_product_detail('p.id', product_id, PRODUCT_DETAIL_STMT, fields)
+        if response is None:
+            return jsonify({'success': False, 'message': f'Product with ID {product_id} not found'}), 404
         return jsonify(response)
+    except DB_TIMEOUT_ERRORS as e:
+        return timeout_response(e)
     except Exception as e:
         print(f"Error fetching product details: {e}")
         return jsonify({
@@ -112,18 +201,30 @@ def get_product_detail(product_id):
 def get_product_by_code(product_code):
     """
     Fetch detailed information about a specific product by its code.
+
+    The code is resolved through this worker's product_index, so the lookup
+    runs the same by-id statement as /product/<id>; codes the index doesn't
+    know (yet) are looked up by code and added to it.
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("SELECT id FROM products WHERE product_code = %s", (product_code,))
-        product_id_record = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        if not product_id_record:
+        fields = parse_fields(request.args.get('fields'), DETAIL_FIELDS)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    try:
+        response = None
+        product_id = code_index.lookup(product_code)
+        if product_id is not None:
+            response = fetch_product_detail('p.id', product_id, PRODUCT_DETAIL_STMT, fields)
+        if response is None:
+            response = fetch_product_detail('p.product_code', product_code, PRODUCT_DETAIL_BY_CODE_STMT, fields)
+            if response is not None:
+                code_index.add(product_code, response['product']['id'])
+        if response is None:
             return jsonify({'success': False, 'message': f'Product with code {product_code} not found'}), 404
-        # Call the existing function with the ID
-        return get_product_detail(product_id_record['id'])
+        return jsonify(response)
+    except DB_TIMEOUT_ERRORS as e:
+        return timeout_response(e)
     except Exception as e:
         print(f"Error fetching product by code: {e}")
         return jsonify({
@@ -131,11 +232,145 @@ def get_product_by_code(product_code):
             'message': 'Failed to fetch product details',
             'error': str(e)
         }), 500
-        return get_product_detail(product_id_record['id'])
+
+
+@product_detail_bp.route('/product/<int:product_id>/reviews', methods=['GET'])
+def get_product_reviews(product_id):
+    """
+    A product's reviews, newest first: ?limit= (default
+    DEFAULT_REVIEWS_PAGE_SIZE, at most MAX_REVIEWS_PAGE_SIZE) and ?cursor=
+    (a next_cursor, or the detail page's reviews_next_cursor).
+
+    Returns {success, reviews, next_cursor}; next_cursor is null on the last
+    page. Pages are read in (created_at, id) order and resume after the cursor,
+    so with the (product_id, created_at, id) index every page costs the same.
+    """
+    try:
+        limit = int(request.args.get('limit', DEFAULT_REVIEWS_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'success': False, 'message': "'limit' must be an integer"}), 400
+    if not 1 <= limit <= MAX_REVIEWS_PAGE_SIZE:
+        return jsonify({'success': False, 'message': f"'limit' must be between 1 and {MAX_REVIEWS_PAGE_SIZE}"}), 400
+    cursor_arg = request.args.get('cursor')
+    try:
+        after = decode_review_cursor(cursor_arg) if cursor_arg else None
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        condition = "AND (created_at, id) < (%s, %s)" if after else ""
+        cursor.execute(f"""
+            SELECT id, rating, review, reviewer_name, created_at
+            FROM product_reviews
+            WHERE product_id = %s {condition}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+        """, (product_id, *(after or ()), limit + 1))
+        reviews, next_cursor = review_page(cursor.fetchall(), limit)
+
+        if not reviews and after is None:
+            cursor.execute("SELECT 1 FROM products WHERE id = %s", (product_id,))
+            if cursor.fetchone() is None:
+                return jsonify({'success': False, 'message': f'Product with ID {product_id} not found'}), 404
+
+        return jsonify({'success': True, 'reviews': reviews, 'next_cursor': next_cursor})
+    except DB_TIMEOUT_ERRORS as e:
+        return timeout_response(e)
     except Exception as e:
-        print(f"Error fetching product by code: {e}")
+        print(f"Error fetching product reviews: {e}")
         return jsonify({
             'success': False,
-            'message': 'Failed to fetch product details',
+            'message': 'Failed to fetch reviews',
             'error': str(e)
         }), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+def parse_batch_args(args):
+    """(ids, codes) from ?ids=1,2&codes=A,B, de-duplicated in request order. Raises ValueError."""
+    def split(name):
+        return list(dict.fromkeys(v.strip() for v in args.get(name, '').split(',') if v.strip()))
+
+    try:
+        ids = [int(v) for v in split('ids')]
+    except ValueError:
+        raise ValueError("'ids' must be a comma-separated list of integers")
+    codes = split('codes')
+    if not ids and not codes:
+        raise ValueError("Provide 'ids' and/or 'codes'")
+    if len(ids) + len(codes) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} products per batch")
+    return ids, codes
+
+
+@product_detail_bp.route('/products/batch', methods=['GET'])
+def get_products_batch():
+    """
+    Detail documents for several products in one request:
+    /products/batch?ids=1,2,3&codes=AB-1 (at most MAX_BATCH_SIZE in total).
+
+    Returns {success, products, missing}: products holds one detail document
+    (the /product/<id> response without 'success') per product found, in
+    request order, and missing lists the ids and codes that matched nothing.
+    Accepts ?fields= like /product/<id>.
+    """
+    try:
+        ids, codes = parse_batch_args(request.args)
+        fields = parse_fields(request.args.get('fields'), DETAIL_FIELDS)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    # The keys are needed to put the documents back in request order
+    query_fields = list(dict.fromkeys([*fields, 'product_code']))
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(detail_query(query_fields, "p.id = ANY(%s) OR p.product_code = ANY(%s)"), (ids, codes))
+        rows = cursor.fetchall()
+
+        by_id = {}
+        by_code = {}
+        for row in rows:
+            document = build_detail_response(row, fields)
+            del document['success']
+            if 'product_code' not in fields:
+                document['product'].pop('product_code', None)
+            by_id[row['id']] = document
+            by_code[row['product_code']] = document
+
+        products = []
+        seen = set()
+        missing = []
+        for key, index in [*((i, by_id) for i in ids), *((c, by_code) for c in codes)]:
+            document = index.get(key)
+            if document is None:
+                missing.append(key)
+            elif id(document) not in seen:
+                seen.add(id(document))
+                products.append(document)
+
+        return jsonify({'success': True, 'products': products, 'missing': missing})
+    except DB_TIMEOUT_ERRORS as e:
+        return timeout_response(e)
+    except Exception as e:
+        print(f"Error fetching product batch: {e}")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to fetch products',
+            'error': str(e)
+        }), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
@@ -0,0 +1,160 @@
+"""
+Worker-local indexes over the products table.
+
+- code_index (product_code -> id): /product/code/<code> resolves the code here
+  and then runs the same statement as /product/<id>.
+- prefix_index: /products/suggest answers search-as-you-type from sorted
+  arrays of product names and codes, without touching Postgres.
+
+Each is loaded once per worker (at startup via gunicorn.conf.py, or on first
+use) and dropped whenever the products tag is invalidated
+(catalog_cache.on_invalidate), which covers this worker's admin writes and,
+through catalog_listener, everyone else's; the next lookup reloads it. One
+loaded during a replica hold (see catalog_cache) may predate the write that
+started it, so it is only kept until the hold ends and then loaded once more.
+
+A code that isn't in code_index may simply be newer than it, so callers fall
+back to querying by code and add() what they find.
+"""
+import time
+import heapq
+import bisect
+import logging
+import threading
+
+import catalog_cache
+from db import get_connection, CATALOG
+
+
+def _query(sql):
+    conn = get_connection(readonly=True, route_class=CATALOG)
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(sql)
+        return cur.fetchall()
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def _load_codes():
+    return dict(_query("SELECT product_code, id FROM products"))
+
+
+def _load_names():
+    return _query("SELECT id, name, product_code FROM products")
+
+
+class _LoadedIndex:
+    """Data built by `loader`, loaded lazily and dropped by reset()."""
+
+    def __init__(self, loader):
+        self._loader = loader
+        # (data, monotonic expiry or None), swapped as a whole
+        self._loaded = None
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def build(self, loaded):
+        """Turn what the loader returned into the index's data."""
+        return loaded
+
+    def load(self):
+        """(Re)load the index and return its data."""
+        version = self._version
+        data = self.build(self._loader())
+        with self._lock:
+            # Keep it unless it was invalidated meanwhile; if it may have come
+            # from a replica that hasn't caught up yet, only until the hold ends
+            if version == self._version:
+                self._loaded = (data, catalog_cache.catalog_cache.hold_until())
+        return data
+
+    def current(self):
+        """The index's data, loading it if needed; None when it can't be loaded."""
+        loaded = self._loaded
+        data = None
+        if loaded is not None and (loaded[1] is None or time.monotonic() < loaded[1]):
+            data = loaded[0]
+        if data is None:
+            try:
+                data = self.load()
+            except Exception as e:
+                logging.warning(f"Could not load {type(self).__name__}: {e}")
+                return None
+        return data
+
+    def reset(self):
+        with self._lock:
+            self._version += 1
+            self._loaded = None
+
+
+class CodeIndex(_LoadedIndex):
+    """product_code -> id."""
+
+    def lookup(self, code):
+        """The id for `code`, or None when unknown (or the map can't be loaded)."""
+        codes = self.current()
+        return codes.get(code) if codes is not None else None
+
+    def add(self, code, product_id):
+        with self._lock:
+            if self._loaded is not None:
+                self._loaded[0][code] = product_id
+
+
+class PrefixIndex(_LoadedIndex):
+    """
+    Prefix search over product names and codes, as sorted arrays and bisect.
+
+    Every product is filed under its lowercased code, its full name and each
+    later word of its name, so 'tray' finds 'Round Tray'. Matches on the start
+    of the code or name come before matches on a later word.
+
+    Every entry under the prefix is looked at, so the results are the best
+    `limit` whatever the prefix; only the best `limit` are kept sorted.
+    """
+
+    def build(self, rows):
+        entries = []
+        for product_id, name, code in rows:
+            product = {'id': product_id, 'name': name, 'code': code}
+            if code:
+                entries.append((code.lower(), 0, product_id, product))
+            words = (name or '').lower().split()
+            for i in range(len(words)):
+                entries.append((' '.join(words[i:]), 0 if i == 0 else 1, product_id, product))
+        entries.sort(key=lambda entry: entry[:3])
+        return [entry[0] for entry in entries], [entry[1:] for entry in entries]
+
+    def suggest(self, prefix, limit):
+        """Up to `limit` products whose name, code or a name word starts with `prefix`."""
+        data = self.current()
+        if data is None:
+            return None
+        keys, entries = data
+        prefix = ' '.join(prefix.lower().split())
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_right(keys, prefix + '\uffff', start)
+
+        best = {}
+        for priority, product_id, product in entries[start:end]:
+            if product_id not in best or priority < best[product_id][0]:
+                best[product_id] = (priority, product)
+        ranked = heapq.nsmallest(limit, best.values(),
+                                 key=lambda match: (match[0], match[1]['name'] or '', match[1]['id']))
+        return [product for _, product in ranked]
+
+
+code_index = CodeIndex(_load_codes)
+prefix_index = PrefixIndex(_load_names)
+catalog_cache.on_invalidate(code_index.reset, catalog_cache.PRODUCTS)
+catalog_cache.on_invalidate(prefix_index.reset, catalog_cache.PRODUCTS)
+
+
+def warm():
+    """Load this worker's indexes now (e.g. from gunicorn's post_fork)."""
+    return len(code_index.load()), len(prefix_index.load()[0])
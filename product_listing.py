@@ -0,0 +1,152 @@
+"""
+The product_listing materialized view (migrations/0004_product_listing_view.sql).
+
+GET /products reads the listing from this view, so its image, stock,
+attributes and review summary are only as fresh as the last refresh. The
+refresh uses REFRESH MATERIALIZED VIEW CONCURRENTLY, so the listing keeps
+being served from the old contents while the new ones are built, and happens:
+
+- right after the admin routes change products or stock (refresh_after_write()),
+- shortly after checkout takes stock (request_refresh(): one background
+  refresh per REFRESH_DELAY seconds however many orders came in, so listing
+  stock is eventually consistent, typically within a few seconds),
+- on a schedule for everything else (reviews, which only reach the view this
+  way, and direct edits): gunicorn's master starts
+  `python product_listing.py --every SCHEDULE_EVERY` (start_scheduler(), from
+  gunicorn.conf.py); with PRODUCT_LISTING_REFRESH_EVERY=0 it doesn't, and
+  `python product_listing.py` should run from cron instead.
+
+Only one refresh runs at a time across all workers: refresh() takes a
+transaction-level advisory lock first and skips when another refresh holds
+it, rather than queueing behind that one on the view's lock. After each
+refresh a 'product_listing' notification goes out on the catalog channel, so
+every worker's catalog_listener drops its cached listing pages.
+
+Run with: python product_listing.py                 refresh once
+          python product_listing.py --every SECS    refresh every SECS seconds
+"""
+import os
+import sys
+import subprocess
+import time
+import logging
+import threading
+
+import catalog_cache
+from catalog_listener import CHANNEL
+from db import get_connection, ADMIN
+
+VIEW = 'product_listing'
+
+# Advisory lock key held by whichever refresh is running
+REFRESH_LOCK = 0x706c7266
+
+# Seconds request_refresh() waits, collecting further requests, before refreshing
+try:
+    REFRESH_DELAY = float(os.environ.get('PRODUCT_LISTING_REFRESH_DELAY', 2))
+except (TypeError, ValueError):
+    REFRESH_DELAY = 2.0
+
+# Seconds between scheduled refreshes; 0 leaves scheduling to something else
+try:
+    SCHEDULE_EVERY = float(os.environ.get('PRODUCT_LISTING_REFRESH_EVERY', 60))
+except (TypeError, ValueError):
+    SCHEDULE_EVERY = 60.0
+
+
+def refresh():
+    """
+    Rebuild the view, tell every worker, and drop this worker's cached listing.
+    Returns False, doing nothing, when another refresh is already running.
+    """
+    conn = get_connection(route_class=ADMIN)
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (REFRESH_LOCK,))
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return False
+        cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {VIEW}")
+        # Delivered on commit, i.e. once the new contents are visible
+        cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, VIEW))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+    catalog_cache.invalidate(catalog_cache.PRODUCT_LISTING)
+    return True
+
+
+def refresh_after_write():
+    """
+    refresh() after an admin write has committed. A failure is logged rather
+    than raised: the write itself succeeded, and the scheduled refresh will
+    pick it up, as it does a write that a skipped refresh may have missed.
+    """
+    try:
+        return refresh()
+    except Exception as e:
+        logging.error(f"Failed to refresh {VIEW}: {e}")
+        return False
+
+
+_timer = None
+_timer_lock = threading.Lock()
+
+
+def _refresh_now():
+    global _timer
+    with _timer_lock:
+        _timer = None
+    refresh_after_write()
+
+
+def request_refresh():
+    """
+    Refresh the view in the background, REFRESH_DELAY seconds from now. Calls
+    made before then share that refresh; calls made while it runs get the
+    next one, so no committed change is left out.
+    """
+    global _timer
+    with _timer_lock:
+        if _timer is not None:
+            return False
+        _timer = threading.Timer(REFRESH_DELAY, _refresh_now)
+        _timer.daemon = True
+        _timer.start()
+        return True
+
+
+def start_scheduler(interval=None):
+    """
+    Start `python product_listing.py --every <interval>` (default SCHEDULE_EVERY)
+    as a child process and return it; None when the interval is 0.
+    """
+    interval = SCHEDULE_EVERY if interval is None else interval
+    if interval <= 0:
+        return None
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), '--every', str(interval)])
+
+
+def main(argv):
+    if not argv:
+        refresh()
+        return 0
+    if len(argv) != 2 or argv[0] != '--every':
+        print(__doc__)
+        return 2
+    interval = float(argv[1])
+    while True:
+        started = time.monotonic()
+        refresh_after_write()
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,253 @@
+"""
+Per-request database query instrumentation.
+
+Cursors handed out on request-scoped connections (see db.py) are wrapped in
+InstrumentedCursor, which records every statement's duration on flask.g.
+After each request init_app() attaches the totals as a Server-Timing header:
+
+    Server-Timing: db;dur=14.20;desc="7 queries", db-slowest;dur=5.10
+
+and logs a warning when a route runs more than DB_QUERY_WARN_THRESHOLD
+statements (default 10), which is how N+1 loops show up.
+
+Statements slower than DB_SLOW_QUERY_MS (default 100) are also kept in an
+in-process slow-query log, grouped by fingerprint (the SQL with literals and
+parameters stripped) with count, p50, p95 and max. Statements are recorded
+as the SQL they run: EXECUTE of a statement registered in prepared_statements
+under its registered SQL, and psycopg2.sql.Composed queries rendered against
+the cursor's connection. Each worker keeps its own log; GET /admin/query-stats
+exposes it (routes/admin/query_stats.py).
+"""
+import os
+import re
+import math
+import time
+import logging
+import threading
+from collections import deque
+
+from flask import g, has_app_context, request
+
+
+def _warn_threshold():
+    try:
+        return int(os.environ.get('DB_QUERY_WARN_THRESHOLD', 10))
+    except (TypeError, ValueError):
+        return 10
+
+
+class QueryStats:
+    """Query count, total time and slowest statement for one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_sql = None
+
+    def record(self, sql, duration_ms):
+        self.count += 1
+        self.total_ms += duration_ms
+        if duration_ms >= self.slowest_ms:
+            self.slowest_ms = duration_ms
+            self.slowest_sql = sql
+
+    def server_timing(self):
+        return (f'db;dur={self.total_ms:.2f};desc="{self.count} queries", '
+                f'db-slowest;dur={self.slowest_ms:.2f}')
+
+
+def current_stats():
+    """Stats for the current request, or None outside a request."""
+    if not has_app_context():
+        return None
+    stats = g.get('_query_stats')
+    if stats is None:
+        stats = g._query_stats = QueryStats()
+    return stats
+
+
+_FINGERPRINT_RULES = [
+    (re.compile(r'--[^\n]*'), ' '),                          # line comments
+    (re.compile(r'/\*.*?\*/', re.S), ' '),                   # block comments
+    (re.compile(r"'(?:[^']|'')*'"), '?'),                     # string literals
+    (re.compile(r'\$\d+|%s|%\(\w+\)s'), '?'),                 # bind parameters
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),                   # numeric literals
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(?+)'),       # IN (...) / VALUES lists
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def fingerprint(sql):
+    """Normalise `sql` so statements that differ only in literals group together."""
+    text = sql
+    for pattern, replacement in _FINGERPRINT_RULES:
+        text = pattern.sub(replacement, text)
+    return text.strip().rstrip(';').strip().lower()
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class SlowQueryLog:
+    """Aggregates slow statements per fingerprint (count, p50, p95, max)."""
+
+    def __init__(self, threshold_ms=100.0, samples=500, max_fingerprints=500):
+        self.threshold_ms = threshold_ms
+        self.samples = samples
+        self.max_fingerprints = max_fingerprints
+        self._entries = {}
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def record(self, sql, duration_ms):
+        if duration_ms < self.threshold_ms:
+            return False
+        key = fingerprint(sql)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if len(self._entries) >= self.max_fingerprints:
+                    self._dropped += 1
+                    return False
+                entry = self._entries[key] = {
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'durations': deque(maxlen=self.samples),
+                }
+            entry['count'] += 1
+            entry['total_ms'] += duration_ms
+            entry['max_ms'] = max(entry['max_ms'], duration_ms)
+            entry['durations'].append(duration_ms)
+        return True
+
+    def snapshot(self):
+        """Aggregates sorted by total time, worst first."""
+        with self._lock:
+            entries = [(key, dict(e, durations=sorted(e['durations']))) for key, e in self._entries.items()]
+            dropped = self._dropped
+        statements = [
+            {
+                'fingerprint': key,
+                'count': e['count'],
+                'total_ms': round(e['total_ms'], 2),
+                'p50_ms': round(_percentile(e['durations'], 50), 2),
+                'p95_ms': round(_percentile(e['durations'], 95), 2),
+                'max_ms': round(e['max_ms'], 2),
+            }
+            for key, e in entries
+        ]
+        statements.sort(key=lambda s: s['total_ms'], reverse=True)
+        return {
+            'threshold_ms': self.threshold_ms,
+            'dropped_fingerprints': dropped,
+            'statements': statements,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self._dropped = 0
+
+
+def _slow_threshold_ms():
+    try:
+        return float(os.environ.get('DB_SLOW_QUERY_MS', 100))
+    except (TypeError, ValueError):
+        return 100.0
+
+
+slow_query_log = SlowQueryLog(threshold_ms=_slow_threshold_ms())
+
+
+def record_query(sql, duration_ms):
+    stats = current_stats()
+    if stats is not None:
+        stats.record(sql, duration_ms)
+    if slow_query_log.record(sql, duration_ms):
+        logging.warning(f"Slow query ({duration_ms:.1f} ms): {_compact(sql)}")
+
+
+_EXECUTE = re.compile(r'\s*EXECUTE\s+([a-z_][a-z0-9_]*)\b', re.I)
+
+
+def _sql_text(query, cursor=None):
+    """The SQL `query` runs: prepared statements resolved, Composed rendered."""
+    if not isinstance(query, str):
+        try:
+            return query.as_string(cursor)
+        except Exception:
+            return str(query)
+    match = _EXECUTE.match(query)
+    if match:
+        # Imported here: prepared_statements imports db, which imports this module
+        import prepared_statements
+        return prepared_statements.registered().get(match.group(1).lower(), query)
+    return query
+
+
+class InstrumentedCursor:
+    """Cursor proxy that times execute()/executemany() and records them for the request."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cursor.close()
+
+    def execute(self, query, params=None):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(query, params)
+        finally:
+            record_query(_sql_text(query, self._cursor), (time.perf_counter() - start) * 1000)
+
+    def executemany(self, query, params_seq):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, params_seq)
+        finally:
+            record_query(_sql_text(query, self._cursor), (time.perf_counter() - start) * 1000)
+
+
+def _compact(sql, limit=200):
+    text = ' '.join(sql.split())
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def add_server_timing(response):
+    """after_request hook: expose the request's DB totals and flag chatty routes."""
+    stats = g.get('_query_stats')
+    if stats is None or not stats.count:
+        return response
+
+    response.headers.add('Server-Timing', stats.server_timing())
+
+    threshold = _warn_threshold()
+    if threshold and stats.count > threshold:
+        logging.warning(
+            f"{request.method} {request.path} ({request.endpoint}) ran {stats.count} queries "
+            f"in {stats.total_ms:.1f} ms (threshold {threshold}); "
+            f"slowest {stats.slowest_ms:.1f} ms: {_compact(stats.slowest_sql or '')}"
+        )
+    return response
+
+
+def init_app(app):
+    """Emit Server-Timing headers and N+1 warnings for `app`."""
+    app.after_request(add_server_timing)
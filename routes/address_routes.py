@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-import psycopg2
+from db import get_connection, CATALOG, DEFAULT, DB_TIMEOUT_ERRORS, timeout_response
 from psycopg2.extras import RealDictCursor
 import os
 from dotenv import load_dotenv
@@ -12,15 +12,8 @@ address_bp = Blueprint('address', __name__)
 
 # ------------------------- DB CONNECTION -------------------------
 
-def get_db_connection(cursor_factory=None):
-    conn = psycopg2.connect(
-        host=os.environ.get('DB_HOST'),
-        database=os.environ.get('DB_NAME'),
-        user=os.environ.get('DB_USER'),
-        password=os.environ.get('DB_PASSWORD'),
-        port=os.environ.get('DB_PORT', 5432),
-        sslmode=os.getenv('DB_SSLMODE', 'require')
-    )
+def get_db_connection(cursor_factory=None, readonly=False, route_class=DEFAULT):
+    conn = get_connection(readonly=readonly, route_class=route_class)
     cur = conn.cursor(cursor_factory=cursor_factory)
     return conn, cur
 
@@ -151,11 +144,13 @@ def send_admin_cod_notification(order):
 
 @address_bp.route('/provinces', methods=['GET'])
 def get_provinces():
-    conn, cur = get_db_connection(cursor_factory=RealDictCursor)
+    conn, cur = get_db_connection(cursor_factory=RealDictCursor, readonly=True, route_class=CATALOG)
     try:
         cur.execute("SELECT id, name FROM provinces ORDER BY name")
         provinces = cur.fetchall()
         return jsonify({'success': True, 'provinces': provinces})
+    except DB_TIMEOUT_ERRORS as e:
+        return timeout_response(e)
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
     finally:
@@ -201,6 +196,9 @@ def create_shipping_address():
                 'message': 'Shipping address created successfully'
             })
 
+        except DB_TIMEOUT_ERRORS as e:
+            conn.rollback()
+            return timeout_response(e)
         except Exception as e:
             conn.rollback()
             return jsonify({'success': False, 'message': str(e)}), 500
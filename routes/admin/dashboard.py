@@ -1,7 +1,7 @@
 from flask import Blueprint, jsonify
 from auth.token_validator import require_admin
 import os
-import psycopg2
+from db import get_connection, ADMIN
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 
@@ -9,22 +9,15 @@ load_dotenv()
 
 admin_dashboard_bp = Blueprint('admin_dashboard', __name__)
 
-def get_db_connection(cursor_factory=None):
-    conn = psycopg2.connect(
-        host=os.environ.get('DB_HOST'),
-        database=os.environ.get('DB_NAME'),
-        user=os.environ.get('DB_USER'),
-        password=os.environ.get('DB_PASSWORD'),
-        port=os.environ.get('DB_PORT', 5432),
-        sslmode=os.getenv('DB_SSLMODE', 'require')
-    )
+def get_db_connection(cursor_factory=None, readonly=False):
+    conn = get_connection(readonly=readonly, route_class=ADMIN)
     cur = conn.cursor(cursor_factory=cursor_factory)
     return conn, cur
 
 @admin_dashboard_bp.route('/admin/dashboard', methods=['GET'])
 @require_admin
 def get_dashboard():
-    conn, cur = get_db_connection(cursor_factory=RealDictCursor)
+    conn, cur = get_db_connection(cursor_factory=RealDictCursor, readonly=True)
     try:
         # Get dashboard summary
         cur.execute("SELECT * FROM admin_dashboard")
@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
 from auth.token_validator import require_admin
 import os
-import psycopg2
+from db import get_connection, ADMIN
+import catalog_cache
+import product_listing
 from dotenv import load_dotenv
 
 load_dotenv() 
@@ -9,14 +11,7 @@ load_dotenv()
 admin_inventory_bp = Blueprint('admin_inventory', __name__)
 
 def get_db_connection():
-    conn = psycopg2.connect(
-        host=os.environ.get('DB_HOST'),
-        database=os.environ.get('DB_NAME'),
-        user=os.environ.get('DB_USER'),
-        password=os.environ.get('DB_PASSWORD'),
-        port=os.environ.get('DB_PORT', 5432),
-        sslmode=os.getenv('DB_SSLMODE', 'require')
-    )
+    conn = get_connection(route_class=ADMIN)
     cur = conn.cursor()
     return conn, cur
 
@@ -36,6 +31,9 @@ def update_stock(product_id):
         """, (new_quantity, product_id))
         updated = cur.fetchone()
         conn.commit()
+        if updated:
+            catalog_cache.invalidate(catalog_cache.INVENTORY)
+            product_listing.refresh_after_write()
         
         if not updated:
             return jsonify({'success': False, 'message': 'Product not found'}), 404
@@ -1,7 +1,7 @@
 from flask import Blueprint, request, jsonify
 from auth.token_validator import require_admin
 import os
-import psycopg2
+from db import get_connection, ADMIN
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 
@@ -9,22 +9,15 @@ load_dotenv()
 
 admin_orders_bp = Blueprint('admin_orders', __name__)
 
-def get_db_connection(cursor_factory=None):
-    conn = psycopg2.connect(
-        host=os.environ.get('DB_HOST'),
-        database=os.environ.get('DB_NAME'),
-        user=os.environ.get('DB_USER'),
-        password=os.environ.get('DB_PASSWORD'),
-        port=os.environ.get('DB_PORT', 5432),
-        sslmode=os.getenv('DB_SSLMODE', 'require')
-    )
+def get_db_connection(cursor_factory=None, readonly=False):
+    conn = get_connection(readonly=readonly, route_class=ADMIN)
     cur = conn.cursor(cursor_factory=cursor_factory)
     return conn, cur
 
 @admin_orders_bp.route('/admin/orders', methods=['GET'])
 @require_admin
 def list_orders():
-    conn, cur = get_db_connection(cursor_factory=RealDictCursor)
+    conn, cur = get_db_connection(cursor_factory=RealDictCursor, readonly=True)
     try:
         cur.execute("""
             SELECT o.*, c.name as customer_name, c.email as customer_email,
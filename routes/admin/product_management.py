@@ -1,8 +1,10 @@
 from flask import Blueprint, request, jsonify
 from auth.token_validator import require_admin
 import os
-import psycopg2
+from db import get_connection, ADMIN, DB_TIMEOUT_ERRORS, timeout_response
 from psycopg2.extras import RealDictCursor
+import catalog_cache
+import product_listing
 
 from dotenv import load_dotenv
 
@@ -10,22 +12,15 @@ load_dotenv()
 
 admin_products_bp = Blueprint('admin_products', __name__)
 
-def get_db_connection(cursor_factory=None):
-    conn = psycopg2.connect(
-        host=os.environ.get('DB_HOST'),
-        database=os.environ.get('DB_NAME'),
-        user=os.environ.get('DB_USER'),
-        password=os.environ.get('DB_PASSWORD'),
-        port=os.environ.get('DB_PORT', 5432),
-        sslmode=os.getenv('DB_SSLMODE', 'require')
-    )
+def get_db_connection(cursor_factory=None, readonly=False):
+    conn = get_connection(readonly=readonly, route_class=ADMIN)
     cur = conn.cursor(cursor_factory=cursor_factory)
     return conn, cur
 
 @admin_products_bp.route('/admin/products', methods=['GET'])
 @require_admin
 def list_products():
-    conn, cur = get_db_connection(cursor_factory=RealDictCursor)
+    conn, cur = get_db_connection(cursor_factory=RealDictCursor, readonly=True)
     try:
         cur.execute("""
             SELECT p.*, i.quantity as stock
@@ -67,7 +62,12 @@ def add_product():
         """, (product_id, data.get('initial_stock', 0)))
 
         conn.commit()
+        catalog_cache.invalidate(catalog_cache.PRODUCTS, catalog_cache.INVENTORY)
+        product_listing.refresh_after_write()
         return jsonify({'success': True, 'product_id': product_id}), 201
+    except DB_TIMEOUT_ERRORS as e:
+        conn.rollback()
+        return timeout_response(e)
     except Exception as e:
         conn.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,17 @@
+from flask import Blueprint, jsonify
+from auth.token_validator import require_admin
+from query_metrics import slow_query_log
+
+admin_query_stats_bp = Blueprint('admin_query_stats', __name__)
+
+@admin_query_stats_bp.route('/admin/query-stats', methods=['GET'])
+@require_admin
+def get_query_stats():
+    """Slow statements seen by this worker, aggregated per fingerprint."""
+    return jsonify({'success': True, **slow_query_log.snapshot()})
+
+@admin_query_stats_bp.route('/admin/query-stats', methods=['DELETE'])
+@require_admin
+def reset_query_stats():
+    slow_query_log.reset()
+    return jsonify({'success': True, 'message': 'Query stats reset'})
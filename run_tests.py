@@ -20,6 +20,17 @@ def run_tests():
         'tests/test_cart_routes.py', 
         'tests/test_contact_routes.py',
         'tests/test_checkout_routes.py',
+        'tests/test_db_pool.py',
+        'tests/test_prepared_statements.py',
+        'tests/test_query_metrics.py',
+        'tests/test_migrate.py',
+        'tests/test_transaction_pooling.py',
+        'tests/test_catalog_cache.py',
+        'tests/test_catalog_listener.py',
+        'tests/test_product_api.py',
+        'tests/test_product_detail_api.py',
+        'tests/test_product_index.py',
+        'tests/test_product_listing.py',
         'payfastpk/test_payfast_api.py'
     ]
     
@@ -0,0 +1,151 @@
+import pytest
+from flask import Flask
+
+import catalog_cache
+from catalog_cache import TTLCache
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(catalog_cache.time, 'monotonic', lambda: now[0])
+    cache = TTLCache(ttl=10)
+    cache.set('k', b'v')
+    assert cache.get('k') == b'v'
+    now[0] += 11
+    assert cache.get('k') is None
+    assert len(cache) == 0
+
+
+def test_invalidate_drops_only_matching_tags():
+    cache = TTLCache(ttl=60)
+    cache.set('listing', b'1', tags=(catalog_cache.PRODUCTS, catalog_cache.INVENTORY))
+    cache.set('provinces', b'2', tags=('provinces',))
+    assert cache.invalidate(catalog_cache.INVENTORY) == 1
+    assert cache.get('listing') is None
+    assert cache.get('provinces') == b'2'
+
+
+def test_set_skips_result_read_before_invalidation():
+    cache = TTLCache(ttl=60)
+    generation = cache.generation()
+    cache.invalidate(catalog_cache.PRODUCTS)
+    assert cache.set('listing', b'stale', generation=generation) is False
+    assert cache.get('listing') is None
+
+
+def test_maxsize_evicts_entry_closest_to_expiry():
+    cache = TTLCache(ttl=60, maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.set('c', 3)
+    assert cache.get('a') is None
+    assert cache.get('c') == 3
+
+
+class CountingCursor:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def execute(self, query, params=None):
+        self.calls.append(query)
+
+    def fetchall(self):
+        return [{'id': 1, 'name': 'Hex Tile', 'official_name': 'HT', 'price': 10, 'description': '',
+                 'primary_image': None, 'product_code': 'HT-1', 'stock': 4, 'type': 'tile'}]
+
+    def fetchone(self):
+        return (4,)
+
+    def close(self):
+        pass
+
+
+class CountingConn:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def cursor(self, cursor_factory=None):
+        return CountingCursor(self.calls)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def client(monkeypatch):
+    from product_api import product_bp
+    from routes.admin.inventory_management import admin_inventory_bp
+
+    calls = []
+    monkeypatch.setattr(catalog_cache, 'catalog_cache', TTLCache(ttl=60))
+    monkeypatch.setattr('product_api.catalog_cache', catalog_cache.catalog_cache)
+    monkeypatch.setattr('product_api.get_db_connection', lambda: CountingConn(calls))
+    monkeypatch.setattr('routes.admin.inventory_management.get_db_connection',
+                        lambda: (CountingConn(calls), CountingCursor(calls)))
+    monkeypatch.setattr('product_listing.get_connection', lambda route_class=None: CountingConn(calls))
+    monkeypatch.setattr('auth.token_validator.verify_token',
+                        lambda token, expected_use=None: {'sub': 'admin-1', 'cognito:groups': ['admin']})
+    app = Flask(__name__)
+    app.register_blueprint(product_bp)
+    app.register_blueprint(admin_inventory_bp)
+    return app.test_client(), calls
+
+
+def test_products_listing_is_served_from_cache(client):
+    client, calls = client
+    first = client.get('/products')
+    second = client.get('/products')
+    assert len(calls) == 1
+    assert second.status_code == 200
+    assert second.get_json() == first.get_json()
+    assert second.mimetype == 'application/json'
+
+
+def test_admin_stock_update_invalidates_listing(client):
+    client, calls = client
+    client.get('/products')
+    response = client.put('/admin/inventory/1', json={'quantity': 9},
+                          headers={'Authorization': 'Bearer token'})
+    assert response.status_code == 200
+    assert any(q.startswith('REFRESH MATERIALIZED VIEW CONCURRENTLY product_listing') for q in calls)
+    client.get('/products')
+    assert sum('FROM product_listing' in q for q in calls) == 2
+
+
+def test_if_none_match_returns_304_without_database(client):
+    client, calls = client
+    etag = client.get('/products').headers['ETag']
+    response = client.get('/products', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert len(calls) == 1
+
+
+def test_etag_changes_with_content():
+    app = Flask(__name__)
+    with app.test_request_context('/'):
+        assert catalog_cache.CachedBody(b'[1]').etag != catalog_cache.CachedBody(b'[2]').etag
+
+
+def test_gzip_copy_served_when_accepted():
+    import gzip
+
+    body = b'[' + b','.join([b'{"title": "Hex Tile"}'] * 200) + b']'
+    app = Flask(__name__)
+    cached = catalog_cache.CachedBody(body)
+    with app.test_request_context('/', headers={'Accept-Encoding': 'gzip, br'}):
+        response = cached.response()
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.get_data()) == body
+        assert response.headers['ETag'] == cached.gzip_etag
+    with app.test_request_context('/'):
+        response = cached.response()
+        assert 'Content-Encoding' not in response.headers
+        assert response.get_data() == body
+        assert response.headers['Vary'] == 'Accept-Encoding'
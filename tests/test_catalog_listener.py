@@ -0,0 +1,71 @@
+import pytest
+
+import catalog_cache
+import catalog_listener
+from catalog_cache import TTLCache
+
+
+class Notify:
+    def __init__(self, payload):
+        self.payload = payload
+
+
+class FakeListenConn:
+    def __init__(self, payloads):
+        self.notifies = []
+        self._pending = [Notify(p) for p in payloads]
+
+    def poll(self):
+        self.notifies.extend(self._pending)
+        self._pending = []
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = TTLCache(ttl=60)
+    monkeypatch.setattr(catalog_cache, 'catalog_cache', cache)
+    monkeypatch.delenv('DB_REPLICA_DSN', raising=False)
+    cache.set('products', b'[]', tags=(catalog_cache.PRODUCTS, catalog_cache.INVENTORY))
+    cache.set('listing', b'[]', tags=(catalog_cache.PRODUCT_LISTING,))
+    return cache
+
+
+def test_notification_evicts_matching_entries(cache):
+    catalog_listener.CatalogListener().drain(FakeListenConn(['inventory']))
+    assert cache.get('products') is None
+    assert cache.get('listing') == b'[]'
+
+
+def test_unknown_table_drops_everything(cache):
+    catalog_listener.handle_notification('mystery')
+    assert len(cache) == 0
+
+
+def test_invalidation_holds_cache_while_replica_catches_up(cache, monkeypatch):
+    monkeypatch.setenv('DB_REPLICA_DSN', 'host=replica')
+    monkeypatch.setenv('DB_REPLICA_MAX_LAG', '5')
+    catalog_listener.handle_notification('products')
+    assert cache.set('products', b'[]') is False
+
+
+def test_start_respects_disable_flag(monkeypatch):
+    monkeypatch.setenv('CATALOG_LISTEN', 'false')
+    assert catalog_listener.start() is None
+
+
+def test_first_connect_starts_no_hold_and_later_ones_do(cache, monkeypatch):
+    monkeypatch.setenv('DB_REPLICA_DSN', 'postgresql://replica')
+    monkeypatch.setenv('DB_REPLICA_MAX_LAG', '30')
+    resets = []
+    monkeypatch.setattr(catalog_cache, '_subscribers', [])
+    catalog_cache.on_invalidate(lambda: resets.append(1), catalog_cache.PRODUCTS)
+    listener = catalog_listener.CatalogListener()
+
+    listener.resync()
+    assert listener.connected.is_set()
+    assert cache.get('products') is None and resets == [1]
+    assert cache.hold_until() is None
+
+    listener.resync()
+    assert resets == [1, 1]
+    assert cache.hold_until() is not None
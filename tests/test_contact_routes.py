@@ -36,6 +36,9 @@ def mock_db(monkeypatch):
         def commit(self):
             self.committed = True
 
+        def rollback(self):
+            self.rolled_back = True
+
         def close(self):
             pass
 
@@ -65,6 +68,24 @@ def test_contact_form_success(client, mock_db, monkeypatch):
     assert 'Form submitted successfully' in data['message']
     assert mock_db.committed is True
 
+def test_contact_form_statement_timeout_returns_503(client, mock_db, monkeypatch):
+    from psycopg2 import errors
+
+    def cancelled(query, params=None):
+        raise errors.QueryCanceled('canceling statement due to statement timeout')
+    monkeypatch.setattr(mock_db.cur, 'execute', cancelled)
+
+    response = client.post('/contact', json={
+        'name': 'John Doe',
+        'email': 'john@example.com',
+        'phone': '+923001234567',
+        'message': 'Test message'
+    })
+
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+    assert mock_db.rolled_back is True
+
 def test_contact_form_missing_fields(client):
     response = client.post('/contact', json={
         'name': 'John Doe',
@@ -0,0 +1,284 @@
+import pytest
+from psycopg2 import extensions
+
+import db
+
+
+class FakeInfo:
+    def __init__(self):
+        self.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        if self.conn.dead:
+            raise db.psycopg2.OperationalError("server closed the connection")
+        self.conn.executed.append(query)
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    timeouts = None
+    local_timeouts = None
+
+    def __init__(self):
+        self.closed = 0
+        self.info = FakeInfo()
+        self.rolled_back = False
+        self.autocommit = False
+        self.dead = False
+        self.executed = []
+
+    def cursor(self, cursor_factory=None):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rolled_back = True
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def fake_connect(monkeypatch):
+    opened = []
+
+    def connect(**kwargs):
+        conn = FakeConn()
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(db.psycopg2, 'connect', connect)
+    return opened
+
+
+def test_pool_opens_min_connections_eagerly(fake_connect):
+    db.ConnectionPool(minconn=2, maxconn=5, timeout=0.1)
+    assert len(fake_connect) == 2
+
+
+def test_pool_reuses_returned_connection(fake_connect):
+    pool = db.ConnectionPool(minconn=0, maxconn=2, timeout=0.1)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(fake_connect) == 1
+
+
+def test_pool_times_out_when_exhausted(fake_connect):
+    pool = db.ConnectionPool(minconn=0, maxconn=1, timeout=0.05)
+    pool.getconn()
+    with pytest.raises(db.PoolTimeout):
+        pool.getconn()
+
+
+def test_putconn_rolls_back_open_transaction(fake_connect):
+    pool = db.ConnectionPool(minconn=0, maxconn=1, timeout=0.1)
+    conn = pool.getconn()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rolled_back is True
+    assert pool.getconn() is conn
+
+
+def test_putconn_discards_broken_connection(fake_connect):
+    pool = db.ConnectionPool(minconn=0, maxconn=1, timeout=0.1)
+    conn = pool.getconn()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_UNKNOWN
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.getconn() is not conn
+
+
+def test_pooled_connection_close_returns_to_pool(fake_connect):
+    pool = db.ConnectionPool(minconn=0, maxconn=1, timeout=0.1)
+    proxy = db.PooledConnection(pool, pool.getconn())
+    raw = proxy._conn
+    proxy.close()
+    proxy.close()  # idempotent
+    assert proxy.closed
+    assert not raw.closed
+    assert pool.getconn() is raw
+
+
+def test_getconn_recycles_connection_past_max_lifetime(fake_connect):
+    pool = db.ConnectionPool(minconn=0, maxconn=1, timeout=0.1, max_lifetime=60)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.created_at -= 120
+    fresh = pool.getconn()
+    assert fresh is not conn
+    assert conn.closed
+
+
+def test_getconn_pre_pings_idle_connection(fake_connect):
+    pool = db.ConnectionPool(minconn=0, maxconn=1, timeout=0.1, ping_after=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert conn.executed == ["SELECT 1"]
+    assert conn.autocommit is False
+
+
+def test_getconn_replaces_connection_that_fails_pre_ping(fake_connect):
+    pool = db.ConnectionPool(minconn=0, maxconn=1, timeout=0.1, ping_after=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.dead = True
+    fresh = pool.getconn()
+    assert fresh is not conn
+    assert conn.closed
+    assert len(fake_connect) == 2
+
+
+def test_child_process_does_not_reuse_parent_pool(fake_connect, monkeypatch):
+    parent = db.ConnectionPool(minconn=1, maxconn=1, timeout=0.1)
+    monkeypatch.setattr(db, '_pools', {db.PRIMARY: parent})
+    monkeypatch.setattr(db, '_orphaned_pools', [])
+    monkeypatch.setattr(db.os, 'getpid', lambda: parent.pid + 1)
+    child = db.get_pool()
+    assert child is not parent
+    assert parent in db._orphaned_pools
+    assert not fake_connect[0].closed  # parent's socket left untouched
+
+
+@pytest.fixture
+def request_app(fake_connect, monkeypatch):
+    from flask import Flask
+
+    pool = db.ConnectionPool(minconn=0, maxconn=2, timeout=0.1)
+    monkeypatch.setitem(db._pools, db.PRIMARY, pool)
+    app = Flask(__name__)
+    db.init_app(app)
+    return app, pool
+
+
+def test_request_reuses_one_connection(request_app, fake_connect):
+    app, pool = request_app
+    with app.test_request_context('/'):
+        first = db.get_connection()
+        first.close()
+        second = db.get_connection()
+        nested = db.get_connection()
+        assert second._conn is nested._conn
+        assert len(fake_connect) == 1
+    # teardown_appcontext returned the connection
+    assert pool.getconn() is fake_connect[0]
+
+
+def test_request_handle_close_rolls_back(request_app, fake_connect):
+    app, pool = request_app
+    with app.test_request_context('/'):
+        conn = db.get_connection()
+        conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+        conn.close()
+        assert conn.closed
+        assert fake_connect[0].rolled_back is True
+        assert not fake_connect[0].closed
+
+
+def test_get_connection_without_init_app_is_not_request_scoped(fake_connect, monkeypatch):
+    from flask import Flask
+
+    monkeypatch.setitem(db._pools, db.PRIMARY, db.ConnectionPool(minconn=0, maxconn=2, timeout=0.1))
+    app = Flask(__name__)
+    with app.test_request_context('/'):
+        first = db.get_connection()
+        second = db.get_connection()
+        assert first._conn is not second._conn
+
+
+@pytest.fixture
+def replica(fake_connect, monkeypatch):
+    monkeypatch.setenv('DB_REPLICA_DSN', 'host=replica dbname=shop')
+    monkeypatch.setitem(db._replica_state, 'checked_at', None)
+    monkeypatch.setitem(db._pools, db.PRIMARY, db.ConnectionPool(minconn=0, maxconn=2, timeout=0.1))
+    monkeypatch.setitem(db._pools, db.REPLICA, db.ConnectionPool(minconn=0, maxconn=2, timeout=0.1))
+    lag = {'seconds': 0.0}
+    monkeypatch.setattr(db, 'replica_lag', lambda conn: lag['seconds'])
+    return lag
+
+
+def test_readonly_uses_replica_when_in_sync(replica):
+    conn = db.get_connection(readonly=True)
+    assert conn._pool is db._pools[db.REPLICA]
+
+
+def test_readonly_falls_back_to_primary_when_replica_lags(replica, monkeypatch):
+    monkeypatch.setenv('DB_REPLICA_MAX_LAG', '5')
+    replica['seconds'] = 30.0
+    conn = db.get_connection(readonly=True)
+    assert conn._pool is db._pools[db.PRIMARY]
+
+
+def test_writes_never_use_replica(replica):
+    conn = db.get_connection()
+    assert conn._pool is db._pools[db.PRIMARY]
+
+
+def test_readonly_without_replica_uses_primary(fake_connect, monkeypatch):
+    monkeypatch.delenv('DB_REPLICA_DSN', raising=False)
+    monkeypatch.setitem(db._pools, db.PRIMARY, db.ConnectionPool(minconn=0, maxconn=2, timeout=0.1))
+    conn = db.get_connection(readonly=True)
+    assert conn._pool is db._pools[db.PRIMARY]
+
+
+def test_request_read_after_write_stays_on_primary(replica, monkeypatch):
+    from flask import Flask
+
+    app = Flask(__name__)
+    db.init_app(app)
+    with app.test_request_context('/'):
+        write = db.get_connection()
+        read = db.get_connection(readonly=True)
+        assert read._conn is write._conn
+        assert read._conn._pool is db._pools[db.PRIMARY]
+
+
+def test_route_timeouts_use_env_override(monkeypatch):
+    monkeypatch.setenv('DB_STATEMENT_TIMEOUT_CATALOG_MS', '750')
+    assert db.route_timeouts(db.CATALOG) == (750, db.ROUTE_TIMEOUTS[db.CATALOG][1])
+    assert db.route_timeouts('unknown') == db.ROUTE_TIMEOUTS[db.DEFAULT]
+
+
+def test_apply_timeouts_sets_session_once_per_route_class(fake_connect):
+    conn = FakeConn()
+    db.apply_timeouts(conn, db.CART)
+    db.apply_timeouts(conn, db.CART)
+    assert len(conn.executed) == 1
+    assert 'statement_timeout' in conn.executed[0]
+    assert conn.timeouts == db.ROUTE_TIMEOUTS[db.CART]
+    assert conn.autocommit is False
+
+    db.apply_timeouts(conn, db.ADMIN)
+    assert len(conn.executed) == 2
+
+
+def test_apply_timeouts_skips_open_transaction(fake_connect):
+    conn = FakeConn()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+    db.apply_timeouts(conn, db.CATALOG)
+    assert conn.executed == []
+    assert conn.timeouts is None
+
+
+def test_cancelled_statement_maps_to_503():
+    from flask import Flask
+
+    app = Flask(__name__)
+    db.init_app(app)
+
+    @app.route('/slow')
+    def slow():
+        raise db.errors.QueryCanceled("canceling statement due to statement timeout")
+
+    response = app.test_client().get('/slow')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert response.get_json()['success'] is False
@@ -0,0 +1,66 @@
+import migrate
+
+
+def test_split_statements_ignores_comments_and_quoted_semicolons():
+    sql = """
+    -- leading comment; not a statement
+    INSERT INTO t (a) VALUES ('x;y');  /* block; comment */
+    CREATE FUNCTION f() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('catalog', 'a;b');
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    SELECT "odd;name" FROM t
+    """
+    statements = migrate.split_statements(sql)
+    assert len(statements) == 3
+    assert statements[0] == "INSERT INTO t (a) VALUES ('x;y')"
+    assert statements[1].startswith("CREATE FUNCTION f()")
+    assert statements[1].endswith("$$ LANGUAGE plpgsql")
+    assert statements[2] == 'SELECT "odd;name" FROM t'
+
+
+def test_requires_autocommit_only_for_concurrent_statements():
+    assert migrate.requires_autocommit(["CREATE INDEX CONCURRENTLY IF NOT EXISTS i ON t (a)"])
+    assert not migrate.requires_autocommit(["CREATE INDEX i ON t (a)", "ALTER TABLE t ADD COLUMN b INT"])
+
+
+def test_migration_files_parse():
+    migrations = migrate.discover()
+    assert migrations, "expected at least one migration"
+    versions = [version for version, _ in migrations]
+    assert versions == sorted(versions)
+    for _, path in migrations:
+        with open(path) as f:
+            assert migrate.split_statements(f.read())
+
+
+def test_index_pack_is_concurrent():
+    path = dict(migrate.discover())['0001_route_access_path_indexes']
+    with open(path) as f:
+        statements = migrate.split_statements(f.read())
+    assert len(statements) == 6
+    assert all(migrate._CONCURRENT_INDEX.search(s) for s in statements)
+    assert migrate.requires_autocommit(statements)
+
+
+def test_review_stats_backfill_runs_in_one_transaction():
+    path = dict(migrate.discover())['0005_product_review_stats']
+    with open(path) as f:
+        statements = migrate.split_statements(f.read())
+    assert not migrate.requires_autocommit(statements)
+    lock = next(i for i, s in enumerate(statements) if s.startswith('LOCK TABLE product_reviews'))
+    backfill = next(i for i, s in enumerate(statements) if s.startswith('INSERT INTO product_review_stats'))
+    assert lock < backfill
+
+
+def test_search_index_matches_the_query_expression():
+    import product_api
+
+    path = dict(migrate.discover())['0007_product_search']
+    with open(path) as f:
+        index = next(s for s in migrate.split_statements(f.read()) if 'idx_products_search_document' in s)
+    normalize = lambda sql: ''.join(sql.replace('p.', '').split())
+    assert normalize(product_api.SEARCH_DOCUMENT) in normalize(index)
+    assert migrate.requires_autocommit([index])
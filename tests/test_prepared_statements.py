@@ -0,0 +1,65 @@
+import pytest
+
+import db
+import prepared_statements
+
+
+class FakePoolConnection:
+    prepared_statements = None
+    stale_statements = None
+
+
+class RecordingCursor:
+    def __init__(self, connection=None):
+        self.connection = connection
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+
+@pytest.fixture
+def pooled_cursor(monkeypatch):
+    monkeypatch.setattr(db, 'PoolConnection', FakePoolConnection)
+    return RecordingCursor(FakePoolConnection())
+
+
+@pytest.fixture
+def statement():
+    name = prepared_statements.register(
+        'test_items_for_user', "SELECT id FROM items WHERE user_id = %s AND code LIKE 'A%%' LIMIT %s")
+    yield name
+    prepared_statements._statements.pop(name, None)
+
+
+def test_to_positional_numbers_placeholders_and_unescapes_percent():
+    sql, count = prepared_statements.to_positional("SELECT %s, %s WHERE x LIKE 'a%%'")
+    assert sql == "SELECT $1, $2 WHERE x LIKE 'a%'"
+    assert count == 2
+
+
+def test_first_execute_prepares_then_executes(pooled_cursor, statement):
+    prepared_statements.execute(pooled_cursor, statement, ('u1', 5))
+    assert pooled_cursor.executed == [
+        ("PREPARE test_items_for_user AS SELECT id FROM items WHERE user_id = $1 AND code LIKE 'A%' LIMIT $2", None),
+        ("EXECUTE test_items_for_user (%s, %s)", ('u1', 5)),
+    ]
+
+
+def test_later_executes_skip_prepare(pooled_cursor, statement):
+    prepared_statements.execute(pooled_cursor, statement, ('u1', 5))
+    prepared_statements.execute(pooled_cursor, statement, ('u2', 5))
+    assert [q for q, _ in pooled_cursor.executed].count(
+        "PREPARE test_items_for_user AS SELECT id FROM items WHERE user_id = $1 AND code LIKE 'A%' LIMIT $2") == 1
+    assert pooled_cursor.executed[-1] == ("EXECUTE test_items_for_user (%s, %s)", ('u2', 5))
+
+
+def test_unpooled_cursor_runs_plain_sql(statement):
+    cur = RecordingCursor()
+    prepared_statements.execute(cur, statement, ('u1', 5))
+    assert cur.executed == [(prepared_statements.registered()[statement], ('u1', 5))]
+
+
+def test_register_rejects_conflicting_sql(statement):
+    with pytest.raises(ValueError):
+        prepared_statements.register(statement, "SELECT 1")
@@ -0,0 +1,263 @@
+import pytest
+from flask import Flask
+
+import product_api
+from catalog_cache import TTLCache
+
+
+def make_row(product_id, name):
+    return {'id': product_id, 'title': name, 'official_name': name, 'price': 10, 'description': '',
+            'image': None, 'code': f'P-{product_id}', 'stock': 3, 'type': 'pack',
+            '_sort_name': name, '_sort_id': product_id}
+
+
+ROWS = [make_row(1, 'Alpha'), make_row(2, 'Beta'), make_row(3, 'Beta'), make_row(4, 'Gamma')]
+
+
+class RecordingCursor:
+    """Records every statement and answers it with respond(query, params) -> rows."""
+
+    def __init__(self, executed, respond):
+        self.executed = executed
+        self.respond = respond
+        self.rows = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+        self.rows = self.respond(query, params)
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class RecordingConn:
+    def __init__(self, executed, respond):
+        self.executed = executed
+        self.respond = respond
+
+    def cursor(self, cursor_factory=None):
+        return RecordingCursor(self.executed, self.respond)
+
+    def close(self):
+        pass
+
+
+def make_client(monkeypatch, respond):
+    """(test client, executed statements) for product_bp on a fresh cache, answered by `respond`."""
+    executed = []
+    monkeypatch.setattr(product_api, 'catalog_cache', TTLCache(ttl=60))
+    monkeypatch.setattr(product_api, 'get_db_connection', lambda: RecordingConn(executed, respond))
+    app = Flask(__name__)
+    app.register_blueprint(product_api.product_bp)
+    return app.test_client(), executed
+
+
+def paging_rows(query, params):
+    """Applies the keyset predicate and LIMIT to ROWS the way Postgres would."""
+    rows = sorted(ROWS, key=lambda r: (r['_sort_name'], r['_sort_id']))
+    if params:
+        *params, limit = params
+        if '(pl.name, pl.id) > (%s, %s)' in query:
+            after = tuple(params[-2:])
+            rows = [r for r in rows if (r['_sort_name'], r['_sort_id']) > after]
+        rows = rows[:limit]
+    return rows
+
+
+@pytest.fixture
+def client(monkeypatch):
+    return make_client(monkeypatch, paging_rows)
+
+
+def test_no_parameters_returns_full_list(client):
+    client, _ = client
+    data = client.get('/products').get_json()
+    assert isinstance(data, list)
+    assert [p['id'] for p in data] == [1, 2, 3, 4]
+    assert '_sort_name' not in data[0]
+
+
+def test_fields_prune_columns_and_joins(client):
+    client, executed = client
+    assert client.get('/products?fields=id,title,price').status_code == 200
+    query, _ = executed[-1]
+    assert 'pl.name AS "title"' in query
+    assert 'description' not in query
+    assert 'FROM product_listing pl' in query and 'JOIN' not in query
+
+
+def test_listing_extras_are_opt_in(client):
+    client, executed = client
+    client.get('/products')
+    assert 'review_count' not in executed[-1][0]
+    client.get('/products?fields=id,average_rating,review_count,attributes')
+    assert 'pl.review_count AS "review_count"' in executed[-1][0]
+    assert 'pl.attributes AS "attributes"' in executed[-1][0]
+
+
+def test_unknown_field_is_rejected(client):
+    client, executed = client
+    response = client.get('/products?fields=id,secret')
+    assert response.status_code == 400
+    assert 'secret' in response.get_json()['message']
+
+
+def test_pages_follow_cursor_across_duplicate_names(client):
+    client, _ = client
+    first = client.get('/products?limit=2').get_json()
+    assert [p['id'] for p in first['products']] == [1, 2]
+    second = client.get(f"/products?limit=2&cursor={first['next_cursor']}").get_json()
+    assert [p['id'] for p in second['products']] == [3, 4]
+    assert second['next_cursor'] is None
+
+
+def test_filters_are_pushed_into_sql(client):
+    client, executed = client
+    client.get('/products?type=pack&food_safe=true&limit=5')
+    query, params = executed[-1]
+    assert 'pl.type = %s' in query and 'pl.food_safe = %s' in query
+    assert params == ('pack', True, 6)
+
+
+@pytest.mark.parametrize('query', ['limit=0', 'limit=abc', f'limit={product_api.MAX_PAGE_SIZE + 1}',
+                                   'cursor=not-a-cursor', 'recyclable=maybe'])
+def test_invalid_parameters_are_rejected(client, query):
+    client, executed = client
+    response = client.get(f'/products?{query}')
+    assert response.status_code == 400
+    assert executed == []
+
+
+def test_cursor_round_trip():
+    assert product_api.decode_cursor(product_api.encode_cursor('Beta', 2)) == ('Beta', 2)
+
+
+@pytest.fixture
+def search_client(monkeypatch):
+    scores = {'fulltext': {1: 0.5, 2: 0.25, 3: 0.25, 4: 0.1}, 'similar': {4: 0.6}}
+
+    def search_rows(query, params):
+        """Ranks ROWS by a per-mode score and applies the (rank, id) keyset like Postgres would."""
+        mode = 'fulltext' if 'ts_rank' in query else 'similar'
+        rows = [dict(r, _rank=scores[mode][r['id']], _sort_id=r['id'])
+                for r in ROWS if r['id'] in scores[mode]]
+        rows.sort(key=lambda r: (r['_rank'], r['_sort_id']), reverse=True)
+        if 'after_rank' in params:
+            after = (params['after_rank'], params['after_id'])
+            rows = [r for r in rows if (r['_rank'], r['_sort_id']) < after]
+        return rows[:params['limit']]
+
+    return (*make_client(monkeypatch, search_rows), scores)
+
+
+def test_search_pages_by_rank(search_client):
+    client, executed, _ = search_client
+    first = client.get('/products/search?q=tray&limit=2').get_json()
+    assert first['match'] == 'fulltext'
+    assert [p['id'] for p in first['products']] == [1, 3]
+    assert set(first['products'][0]) == set(product_api.DEFAULT_LISTING_FIELDS)
+    second = client.get(f"/products/search?q=tray&limit=2&cursor={first['next_cursor']}").get_json()
+    assert [p['id'] for p in second['products']] == [2, 4]
+    assert second['next_cursor'] is None
+    assert executed[-1][1]['q'] == 'tray'
+
+
+def test_search_falls_back_to_similarity(search_client):
+    client, executed, scores = search_client
+    scores['fulltext'] = {}
+    data = client.get('/products/search?q=gama&type=pack').get_json()
+    assert data['match'] == 'similar'
+    assert [p['id'] for p in data['products']] == [4]
+    query, params = executed[-1]
+    assert 'similarity(p.name, %(q)s)' in query and 'pl.type = %(filter_0)s' in query
+    assert params['filter_0'] == 'pack'
+
+
+@pytest.mark.parametrize('query', ['', 'q=', 'q=' + 'x' * 201, 'q=tray&cursor=' + product_api.encode_cursor('Beta', 2)])
+def test_search_rejects_invalid_parameters(search_client, query):
+    client, executed, _ = search_client
+    assert client.get(f'/products/search?{query}').status_code == 400
+    assert executed == []
+
+
+def grouping_row(column=None, value=None, count=0):
+    """A facets_query() row grouped by `column` (None for the total), as GROUPING() would mark it."""
+    columns = [*product_api.FACETS.values(), 'price_bucket']
+    row = {c: None for c in columns}
+    grouping = (1 << len(columns)) - 1
+    if column is not None:
+        row[column] = value
+        grouping ^= 1 << (len(columns) - 1 - columns.index(column))
+    return dict(row, grouping_set=grouping, count=count)
+
+
+FACET_ROWS = [
+    grouping_row(count=6),
+    grouping_row('type', 'tray', 2), grouping_row('type', 'pack', 4),
+    grouping_row('material', None, 1), grouping_row('material', 'aluminum', 5),
+    grouping_row('eco_friendly', True, 6),
+    grouping_row('price_bucket', 3, 1), grouping_row('price_bucket', 1, 2),
+    grouping_row('price_bucket', len(product_api.PRICE_BUCKETS), 3),
+]
+
+
+def test_facets_come_from_one_grouped_query(monkeypatch):
+    client, executed = make_client(monkeypatch, lambda query, params: [dict(row) for row in FACET_ROWS])
+
+    data = client.get('/products/facets?eco_friendly=true').get_json()
+    assert data['total'] == 6
+    assert data['facets']['type'] == [{'value': 'pack', 'count': 4}, {'value': 'tray', 'count': 2}]
+    assert data['facets']['material'] == [{'value': 'aluminum', 'count': 5}]
+    assert data['facets']['food_safe'] == []
+    assert data['facets']['price'] == [
+        {'min': 0, 'max': 250, 'count': 2},
+        {'min': 500, 'max': 1000, 'count': 1},
+        {'min': product_api.PRICE_BUCKETS[-1], 'max': None, 'count': 3},
+    ]
+
+    query, params = executed[0]
+    assert 'GROUP BY GROUPING SETS' in query and 'pl.eco_friendly = %s' in query
+    assert params == (list(product_api.PRICE_BUCKETS), True)
+    client.get('/products/facets?eco_friendly=true')
+    assert len(executed) == 1
+
+
+@pytest.fixture
+def shapes_client(monkeypatch):
+    row = {'id': 9, 'title': 'Round Tray', 'official_name': 'RT', 'price': 40, 'description': '',
+           'image': None, 'code': 'RT-180', 'stock': 5, 'type': 'aluminum_shape',
+           'diameter_mm': 180, 'height_mm': 40, 'volume_cm3': 750}
+    return make_client(monkeypatch, lambda query, params: (
+        [dict(row, distance=0.25)] if '"distance"' in query else [dict(row)]))
+
+
+def test_shapes_filter_by_volume_range_and_footprint(shapes_client):
+    client, executed = shapes_client
+    data = client.get('/products/shapes?min_volume=500&max_volume=1000&diameter=180&tolerance=5').get_json()
+    assert data['shapes'][0]['dimensions'] == {'diameter_mm': 180, 'height_mm': 40, 'volume_cm3': 750}
+    assert data['shapes'][0]['code'] == 'RT-180' and 'diameter_mm' not in data['shapes'][0]
+    query, params = executed[-1]
+    assert 'a.volume_cm3 >= %s AND a.volume_cm3 <= %s AND a.diameter_mm BETWEEN %s AND %s' in query
+    assert 'ORDER BY a.volume_cm3 NULLS LAST, a.product_id' in query
+    assert params == (500, 1000, 175, 185, product_api.DEFAULT_PAGE_SIZE)
+
+
+def test_shapes_nearest_ranks_by_distance(shapes_client):
+    client, executed = shapes_client
+    data = client.get('/products/shapes?nearest=true&diameter=200&height=50&max_volume=900&limit=5').get_json()
+    assert data['shapes'][0]['distance'] == 0.25
+    query, params = executed[-1]
+    assert 'ABS(a.diameter_mm - %s)::float8 / %s + ABS(a.height_mm - %s)::float8 / %s AS "distance"' in query
+    assert 'ORDER BY "distance", a.product_id' in query
+    assert params == (200, 200, 50, 50, 900, 5)
+
+
+@pytest.mark.parametrize('query', ['min_volume=-1', 'min_volume=900&max_volume=100', 'diameter=abc',
+                                   'nearest=true', 'nearest=true&height=0', 'nearest=maybe&height=4'])
+def test_shapes_reject_invalid_parameters(shapes_client, query):
+    client, executed = shapes_client
+    assert client.get(f'/products/shapes?{query}').status_code == 400
+    assert executed == []
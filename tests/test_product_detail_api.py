@@ -0,0 +1,289 @@
+import copy
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+import prepared_statements
+import product_detail_api
+from product_index import CodeIndex
+
+
+DETAIL_ROW = {
+    'id': 7, 'name': 'Round Tray', 'type': 'aluminum_shape', 'price': 120,
+    '_type_details': {'product_id': 7, 'diameter_mm': 180},
+    '_images': [{'id': 1, 'image_url': 'tray.jpg', 'is_primary': True}],
+    '_inventory': 12,
+    '_reviews': [{'rating': 5, 'review': 'Sturdy', 'reviewer_name': 'Sana',
+                  'created_at': '2025-03-01T10:15:00'}],
+    '_average_rating': None,
+    '_total_reviews': 1,
+}
+
+
+class RecordingCursor:
+    def __init__(self, executed, row):
+        self.executed = executed
+        self.row = row
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchone(self):
+        return copy.deepcopy(self.row) if self.row else None
+
+    def fetchall(self):
+        return copy.deepcopy(self.row) if self.row else []
+
+    def close(self):
+        pass
+
+
+class RecordingConn:
+    def __init__(self, executed, row):
+        self.executed = executed
+        self.row = row
+
+    def cursor(self, cursor_factory=None):
+        return RecordingCursor(self.executed, self.row)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def client(monkeypatch):
+    executed = []
+    state = {'row': DETAIL_ROW, 'codes': {}}
+    monkeypatch.setattr(product_detail_api, 'get_db_connection', lambda: RecordingConn(executed, state['row']))
+    monkeypatch.setattr(product_detail_api, 'code_index', CodeIndex(lambda: dict(state['codes'])))
+    app = Flask(__name__)
+    app.register_blueprint(product_detail_api.product_detail_bp)
+    return app.test_client(), executed, state
+
+
+def test_detail_is_one_statement_with_the_same_shape(client):
+    client, executed, _ = client
+    data = client.get('/product/7').get_json()
+    assert len(executed) == 1
+    assert data['product'] == {'id': 7, 'name': 'Round Tray', 'type': 'aluminum_shape', 'price': 120}
+    assert data['type_details'] == {'product_id': 7, 'diameter_mm': 180}
+    assert data['images'][0]['image_url'] == 'tray.jpg'
+    assert data['inventory'] == 12
+    assert data['average_rating'] == 0
+    assert data['total_reviews'] == 1
+    # Same rendering as a datetime column read directly
+    assert data['reviews'][0]['created_at'] == 'Sat, 01 Mar 2025 10:15:00 GMT'
+
+
+def test_lookup_by_code_needs_no_id_round_trip(client):
+    client, executed, _ = client
+    assert client.get('/product/code/RT-7').status_code == 200
+    assert len(executed) == 1
+    assert executed[0][1] == ('RT-7',)
+
+
+def test_indexed_code_runs_the_by_id_statement(client):
+    client, executed, state = client
+    state['codes'] = {'RT-7': 7}
+    data = client.get('/product/code/RT-7').get_json()
+    assert data['product']['id'] == 7
+    assert executed == [(executed[0][0], (7,))]
+    assert executed[0][0].endswith('WHERE p.id = %s')
+
+
+def test_code_found_by_fallback_is_added_to_index(client):
+    client, executed, _ = client
+    client.get('/product/code/RT-7')
+    client.get('/product/code/RT-7')
+    assert [params for _, params in executed] == [('RT-7',), (7,)]
+
+
+def test_missing_product_is_404(client):
+    client, _, state = client
+    state['row'] = None
+    assert client.get('/product/code/NOPE').status_code == 404
+
+
+def test_fields_drop_unrequested_parts_from_the_query():
+    query = product_detail_api.detail_query(['name', 'images'], 'p.id = %s')
+    assert query.startswith('SELECT p.id, p.name, imgs.value AS _images FROM products p')
+    assert 'product_reviews' not in query and 'aluminum_shapes' not in query
+
+
+def test_prepared_detail_names_its_product_columns():
+    query = prepared_statements.registered()[product_detail_api.PRODUCT_DETAIL_STMT]
+    assert 'p.*' not in query
+    assert query.startswith(f"SELECT {', '.join(f'p.{c}' for c in product_detail_api.PRODUCT_COLUMNS)},")
+
+
+def test_review_summary_reads_running_aggregates():
+    query = product_detail_api.detail_query(['average_rating', 'total_reviews'], 'p.id = %s')
+    assert 'LEFT JOIN product_review_stats rs ON rs.product_id = p.id' in query
+    assert 'product_reviews' not in query and 'COUNT(' not in query
+
+
+def test_fields_limit_response_sections(client):
+    client, executed, state = client
+    state['row'] = {'id': 7, 'name': 'Round Tray', '_images': DETAIL_ROW['_images']}
+    data = client.get('/product/7?fields=name,images').get_json()
+    assert set(data) == {'success', 'product', 'images'}
+
+
+def test_unknown_field_is_rejected(client):
+    client, executed, _ = client
+    assert client.get('/product/7?fields=password').status_code == 400
+    assert executed == []
+
+
+def batch_row(product_id, code):
+    return dict(DETAIL_ROW, id=product_id, product_code=code)
+
+
+def test_batch_returns_documents_in_request_order(client):
+    client, executed, state = client
+    state['row'] = [batch_row(1, 'A-1'), batch_row(2, 'B-2')]
+    data = client.get('/products/batch?ids=2,9&codes=A-1').get_json()
+    assert [d['product']['id'] for d in data['products']] == [2, 1]
+    assert data['missing'] == [9]
+    assert 'success' not in data['products'][0]
+    assert len(executed) == 1
+    query, params = executed[0]
+    assert 'p.id = ANY(%s) OR p.product_code = ANY(%s)' in query
+    assert params == ([2, 9], ['A-1'])
+
+
+def test_batch_deduplicates_a_product_requested_by_id_and_code(client):
+    client, _, state = client
+    state['row'] = [batch_row(1, 'A-1')]
+    data = client.get('/products/batch?ids=1,1&codes=A-1').get_json()
+    assert len(data['products']) == 1
+    assert data['missing'] == []
+
+
+@pytest.mark.parametrize('query', ['', 'ids=x', 'ids=' + ','.join(
+    str(i) for i in range(product_detail_api.MAX_BATCH_SIZE + 1))])
+def test_batch_rejects_bad_requests(client, query):
+    client, executed, _ = client
+    assert client.get(f'/products/batch?{query}').status_code == 400
+    assert executed == []
+
+
+REVIEWS = [
+    {'id': i, 'rating': 4, 'review': f'Review {i}', 'reviewer_name': 'Ali',
+     'created_at': datetime(2025, 3, 1 + i // 2)}
+    for i in range(1, 8)
+]
+
+
+class ReviewCursor:
+    """Newest-first keyset paging over REVIEWS, the way Postgres would do it."""
+
+    def __init__(self, executed, reviews):
+        self.executed = executed
+        self.reviews = reviews
+        self.rows = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+        if 'FROM products' in query:
+            self.rows = []
+            return
+        product_id, *after, limit = params
+        rows = sorted(self.reviews, key=lambda r: (r['created_at'], r['id']), reverse=True)
+        if after:
+            rows = [r for r in rows if (r['created_at'], r['id']) < tuple(after)]
+        self.rows = rows[:limit]
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def reviews_client(monkeypatch):
+    executed = []
+    state = {'reviews': REVIEWS}
+
+    class Conn:
+        def cursor(self, cursor_factory=None):
+            return ReviewCursor(executed, state['reviews'])
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(product_detail_api, 'get_db_connection', Conn)
+    app = Flask(__name__)
+    app.register_blueprint(product_detail_api.product_detail_bp)
+    return app.test_client(), executed, state
+
+
+def test_reviews_pages_follow_cursor_through_equal_timestamps(reviews_client):
+    client, executed, _ = reviews_client
+    seen = []
+    cursor = None
+    while True:
+        query = '/product/7/reviews?limit=3' + (f'&cursor={cursor}' if cursor else '')
+        data = client.get(query).get_json()
+        seen += [r['id'] for r in data['reviews']]
+        cursor = data['next_cursor']
+        if cursor is None:
+            break
+    assert seen == [7, 6, 5, 4, 3, 2, 1]
+    assert '(created_at, id) < (%s, %s)' in executed[-1][0]
+
+
+def test_reviews_reject_bad_cursor_and_limit(reviews_client):
+    client, executed, _ = reviews_client
+    assert client.get('/product/7/reviews?cursor=nope').status_code == 400
+    assert client.get('/product/7/reviews?limit=500').status_code == 400
+    assert executed == []
+
+
+def test_reviews_for_unknown_product_is_404(reviews_client):
+    client, _, state = reviews_client
+    state['reviews'] = []
+    assert client.get('/product/999/reviews').status_code == 404
+
+
+def test_detail_links_to_the_next_review_page(client):
+    client, _, state = client
+    reviews = [{'id': i, 'rating': 5, 'review': '', 'reviewer_name': 'Sana',
+                'created_at': f'2025-03-{i:02d}T10:00:00'} for i in range(11, 0, -1)]
+    state['row'] = dict(DETAIL_ROW, _reviews=reviews)
+    data = client.get('/product/7').get_json()
+    assert len(data['reviews']) == product_detail_api.DETAIL_REVIEWS
+    assert product_detail_api.decode_review_cursor(data['reviews_next_cursor']) == (datetime(2025, 3, 2, 10), 2)
+
+
+def test_average_rating_ignores_unrated_reviews():
+    # The 0005 backfill and the detail page's summary columns only use SQL
+    # sqlite shares with Postgres, so run them on a [5, NULL] product
+    import sqlite3
+    import migrate
+
+    path = dict(migrate.discover())['0005_product_review_stats']
+    with open(path) as f:
+        backfill = next(s for s in migrate.split_statements(f.read())
+                        if s.startswith('INSERT INTO product_review_stats'))
+    db = sqlite3.connect(':memory:')
+    db.execute("CREATE TABLE product_reviews (product_id INT, rating REAL)")
+    db.execute("CREATE TABLE product_review_stats (product_id INT PRIMARY KEY, review_count INT, "
+               "rated_count INT, rating_sum REAL)")
+    db.executemany("INSERT INTO product_reviews VALUES (?, ?)", [(7, 5), (7, None), (8, None)])
+    db.execute(backfill)
+
+    summary = next(select for sections, select, _ in product_detail_api.DETAIL_PARTS if 'average_rating' in sections)
+    rows = {row[0]: row[1:] for row in db.execute(
+        f"SELECT p.id, {summary} FROM (SELECT 7 AS id UNION SELECT 8) p "
+        "LEFT JOIN product_review_stats rs ON rs.product_id = p.id")}
+    assert rows[7] == (5.0, 2)
+    assert rows[8] == (None, 1)
+    assert product_detail_api.build_detail_response(
+        {'id': 8, '_average_rating': rows[8][0], '_total_reviews': rows[8][1]},
+        ['average_rating', 'total_reviews'])['average_rating'] == 0
@@ -0,0 +1,128 @@
+import pytest
+
+import catalog_cache
+from catalog_cache import TTLCache
+from product_index import CodeIndex, PrefixIndex
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(monkeypatch):
+    monkeypatch.setattr(catalog_cache, 'catalog_cache', TTLCache(ttl=60))
+    monkeypatch.setattr(catalog_cache, '_subscribers', [])
+
+
+def counting_loader(codes):
+    loads = []
+
+    def load():
+        loads.append(1)
+        return dict(codes)
+    return load, loads
+
+
+def test_map_is_loaded_once_and_reused():
+    load, loads = counting_loader({'RT-7': 7})
+    index = CodeIndex(load)
+    assert index.lookup('RT-7') == 7
+    assert index.lookup('XX-1') is None
+    assert len(loads) == 1
+
+
+def test_products_invalidation_drops_the_map():
+    codes = {'RT-7': 7}
+    load, loads = counting_loader(codes)
+    index = CodeIndex(load)
+    catalog_cache.on_invalidate(index.reset, catalog_cache.PRODUCTS)
+    index.lookup('RT-7')
+
+    catalog_cache.invalidate(catalog_cache.INVENTORY)
+    index.lookup('RT-7')
+    assert len(loads) == 1
+
+    catalog_cache.invalidate(catalog_cache.PRODUCTS)
+    assert index.lookup('RT-7') == 7
+    assert len(loads) == 2
+
+
+def test_map_read_during_replica_hold_is_kept_until_the_hold_ends(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(catalog_cache.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(catalog_cache, '_replica_hold', lambda: 30.0)
+    load, loads = counting_loader({'RT-7': 7})
+    index = CodeIndex(load)
+    catalog_cache.invalidate(catalog_cache.PRODUCTS)
+    index.lookup('RT-7')
+    index.lookup('RT-7')
+    assert len(loads) == 1
+
+    now[0] += 31
+    index.lookup('RT-7')
+    index.lookup('RT-7')
+    assert len(loads) == 2
+
+
+def test_load_failure_falls_back_to_unknown():
+    def broken():
+        raise RuntimeError('database unavailable')
+    assert CodeIndex(broken).lookup('RT-7') is None
+
+
+def test_failing_subscriber_does_not_stop_invalidation():
+    calls = []
+    catalog_cache.on_invalidate(lambda: 1 / 0)
+    catalog_cache.on_invalidate(lambda: calls.append('ok'))
+    catalog_cache.invalidate(catalog_cache.PRODUCTS)
+    assert calls == ['ok']
+
+
+PRODUCTS = [
+    (1, 'Round Tray', 'RT-180'),
+    (2, 'Square Tray', 'SQ-200'),
+    (3, 'Round Lid', 'RL-180'),
+    (4, 'Tray Pack', 'TP-10'),
+]
+
+
+def test_prefix_index_matches_codes_names_and_later_words():
+    index = PrefixIndex(lambda: PRODUCTS)
+    assert [p['id'] for p in index.suggest('round', 10)] == [3, 1]
+    assert [p['id'] for p in index.suggest('RT-1', 10)] == [1]
+    # Name starts rank ahead of later words
+    assert [p['id'] for p in index.suggest('tray', 10)] == [4, 1, 2]
+    assert [p['id'] for p in index.suggest('  round   TR', 10)] == [1]
+    assert index.suggest('tray', 2) == [{'id': 4, 'name': 'Tray Pack', 'code': 'TP-10'},
+                                        {'id': 1, 'name': 'Round Tray', 'code': 'RT-180'}]
+    assert index.suggest('bowl', 10) == []
+
+
+def test_prefix_index_ranks_every_match_not_just_the_first_ones():
+    # Hundreds of later-word matches key ahead of the one name that starts with 'b'
+    rows = [(i, f'Tray b{i:04d}', f'X-{i}') for i in range(1, 800)]
+    rows.append((900, 'Bz Bowl', 'BZ-1'))
+    index = PrefixIndex(lambda: rows)
+    assert index.suggest('b', 3)[0]['id'] == 900
+
+
+def test_prefix_index_is_rebuilt_after_products_change():
+    rows = list(PRODUCTS)
+    index = PrefixIndex(lambda: list(rows))
+    catalog_cache.on_invalidate(index.reset, catalog_cache.PRODUCTS)
+    assert index.suggest('bowl', 10) == []
+    rows.append((5, 'Bowl', 'BW-1'))
+    catalog_cache.invalidate(catalog_cache.PRODUCTS)
+    assert [p['id'] for p in index.suggest('bow', 10)] == [5]
+
+
+def test_suggest_route_never_queries_the_database(monkeypatch):
+    from flask import Flask
+    import product_api
+
+    monkeypatch.setattr(product_api, 'prefix_index', PrefixIndex(lambda: PRODUCTS))
+    monkeypatch.setattr(product_api, 'get_db_connection', lambda: pytest.fail('queried the database'))
+    app = Flask(__name__)
+    app.register_blueprint(product_api.product_bp)
+    client = app.test_client()
+    data = client.get('/products/suggest?prefix=sq').get_json()
+    assert data == {'success': True, 'suggestions': [{'id': 2, 'name': 'Square Tray', 'code': 'SQ-200'}]}
+    assert client.get('/products/suggest').status_code == 400
+    assert client.get('/products/suggest?prefix=sq&limit=50').status_code == 400
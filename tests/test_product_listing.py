@@ -0,0 +1,117 @@
+import pytest
+
+import catalog_cache
+import product_listing
+from catalog_cache import TTLCache
+
+
+class RecordingCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        if self.conn.fail:
+            raise RuntimeError('could not refresh')
+        self.conn.executed.append((query, params))
+
+    def fetchone(self):
+        return (self.conn.locked,)
+
+    def close(self):
+        pass
+
+
+class RecordingConn:
+    def __init__(self, fail=False, locked=True):
+        self.fail = fail
+        self.locked = locked
+        self.executed = []
+        self.committed = False
+        self.rolled_back = False
+
+    def cursor(self):
+        return RecordingCursor(self)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(monkeypatch):
+    monkeypatch.setattr(catalog_cache, 'catalog_cache', TTLCache(ttl=60))
+
+
+def test_refresh_notifies_and_drops_cached_listing(monkeypatch):
+    conn = RecordingConn()
+    monkeypatch.setattr(product_listing, 'get_connection', lambda route_class=None: conn)
+    catalog_cache.catalog_cache.set('products', b'[]', tags=(catalog_cache.PRODUCT_LISTING,))
+
+    assert product_listing.refresh() is True
+
+    assert conn.executed == [
+        ('SELECT pg_try_advisory_xact_lock(%s)', (product_listing.REFRESH_LOCK,)),
+        ('REFRESH MATERIALIZED VIEW CONCURRENTLY product_listing', None),
+        ('SELECT pg_notify(%s, %s)', ('catalog_changes', 'product_listing')),
+    ]
+    assert conn.committed
+    assert catalog_cache.catalog_cache.get('products') is None
+
+
+def test_refresh_is_skipped_while_another_one_runs(monkeypatch):
+    conn = RecordingConn(locked=False)
+    monkeypatch.setattr(product_listing, 'get_connection', lambda route_class=None: conn)
+    catalog_cache.catalog_cache.set('products', b'[]', tags=(catalog_cache.PRODUCT_LISTING,))
+
+    assert product_listing.refresh() is False
+    assert [query for query, _ in conn.executed] == ['SELECT pg_try_advisory_xact_lock(%s)']
+    assert conn.rolled_back and not conn.committed
+    assert catalog_cache.catalog_cache.get('products') == b'[]'
+
+
+def test_failed_refresh_after_write_keeps_cache_and_does_not_raise(monkeypatch):
+    conn = RecordingConn(fail=True)
+    monkeypatch.setattr(product_listing, 'get_connection', lambda route_class=None: conn)
+    catalog_cache.catalog_cache.set('products', b'[]', tags=(catalog_cache.PRODUCT_LISTING,))
+
+    assert product_listing.refresh_after_write() is False
+    assert conn.rolled_back
+    assert catalog_cache.catalog_cache.get('products') == b'[]'
+
+
+def test_start_scheduler_runs_the_every_mode_as_a_child(monkeypatch):
+    started = []
+    monkeypatch.setattr(product_listing.subprocess, 'Popen', lambda args: started.append(args) or args)
+
+    assert product_listing.start_scheduler(0) is None
+    process = product_listing.start_scheduler(30)
+    assert started == [process]
+    assert process[1].endswith('product_listing.py') and process[2:] == ['--every', '30']
+
+
+def test_request_refresh_coalesces_into_one_background_refresh(monkeypatch):
+    import threading
+
+    done = threading.Event()
+    refreshes = []
+
+    def refresh():
+        refreshes.append(1)
+        done.set()
+    monkeypatch.setattr(product_listing, 'refresh_after_write', refresh)
+    monkeypatch.setattr(product_listing, 'REFRESH_DELAY', 0.05)
+
+    assert product_listing.request_refresh() is True
+    assert product_listing.request_refresh() is False
+    assert done.wait(2)
+    assert refreshes == [1]
+    # A change committed after that refresh started gets a refresh of its own
+    done.clear()
+    assert product_listing.request_refresh() is True
+    assert done.wait(2)
+    assert refreshes == [1, 1]
@@ -0,0 +1,155 @@
+import logging
+
+import pytest
+from flask import Flask, jsonify
+
+import query_metrics
+
+
+class FakeCursor:
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    query_metrics.init_app(app)
+
+    @app.route('/chatty/<int:n>')
+    def chatty(n):
+        cur = query_metrics.InstrumentedCursor(FakeCursor())
+        for i in range(n):
+            cur.execute("SELECT name FROM products WHERE id = %s", (i,))
+        return jsonify({'success': True})
+
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def test_server_timing_header_reports_query_count(client):
+    response = client.get('/chatty/3')
+    assert response.status_code == 200
+    timing = response.headers['Server-Timing']
+    assert 'desc="3 queries"' in timing
+    assert 'db-slowest;dur=' in timing
+
+
+def test_no_header_without_queries(client):
+    response = client.get('/chatty/0')
+    assert 'Server-Timing' not in response.headers
+
+
+def test_warns_when_query_count_exceeds_threshold(client, monkeypatch, caplog):
+    monkeypatch.setenv('DB_QUERY_WARN_THRESHOLD', '2')
+    with caplog.at_level(logging.WARNING):
+        client.get('/chatty/3')
+    assert any('ran 3 queries' in r.message and 'chatty' in r.message for r in caplog.records)
+
+
+def test_no_warning_under_threshold(client, monkeypatch, caplog):
+    monkeypatch.setenv('DB_QUERY_WARN_THRESHOLD', '5')
+    with caplog.at_level(logging.WARNING):
+        client.get('/chatty/3')
+    assert not any('queries' in r.message for r in caplog.records)
+
+
+def test_instrumented_cursor_delegates(client):
+    cur = query_metrics.InstrumentedCursor(FakeCursor())
+    assert cur.fetchall() == []
+
+
+def test_fingerprint_strips_literals_and_parameters():
+    a = query_metrics.fingerprint("SELECT * FROM orders WHERE id = 42 AND status = 'paid'")
+    b = query_metrics.fingerprint("select *  from orders where id = %s and status = 'pending';")
+    assert a == b == "select * from orders where id = ? and status = ?"
+    assert query_metrics.fingerprint("SELECT 1 WHERE id IN (1, 2, 3)") == "select ? where id in (?+)"
+
+
+def test_prepared_statements_are_recorded_by_their_sql(monkeypatch):
+    import prepared_statements
+
+    monkeypatch.setattr(prepared_statements, '_statements',
+                        {'cart_items_for_user': "SELECT * FROM cart_items WHERE user_id = %s"})
+    log = query_metrics.SlowQueryLog(threshold_ms=0)
+    monkeypatch.setattr(query_metrics, 'slow_query_log', log)
+    cur = query_metrics.InstrumentedCursor(FakeCursor())
+    cur.execute("EXECUTE cart_items_for_user (%s)", ('user-1',))
+    cur.execute("EXECUTE unknown_statement")
+    assert {s['fingerprint'] for s in log.snapshot()['statements']} == {
+        "select * from cart_items where user_id = ?", "execute unknown_statement"}
+
+
+def test_composed_queries_are_rendered_before_fingerprinting(monkeypatch):
+    class Composed:
+        def as_string(self, context):
+            assert isinstance(context, FakeCursor)
+            return 'SELECT * FROM "orders" WHERE id = %s'
+
+    log = query_metrics.SlowQueryLog(threshold_ms=0)
+    monkeypatch.setattr(query_metrics, 'slow_query_log', log)
+    query_metrics.InstrumentedCursor(FakeCursor()).execute(Composed(), (1,))
+    assert log.snapshot()['statements'][0]['fingerprint'] == 'select * from "orders" where id = ?'
+
+
+def test_slow_query_log_aggregates_per_fingerprint():
+    log = query_metrics.SlowQueryLog(threshold_ms=10)
+    for ms in (5, 20, 30, 40, 100):
+        log.record(f"SELECT * FROM products WHERE id = {int(ms)}", ms)
+    snapshot = log.snapshot()
+    assert len(snapshot['statements']) == 1
+    stmt = snapshot['statements'][0]
+    assert stmt['count'] == 4  # the 5 ms run is under the threshold
+    assert stmt['p50_ms'] == 30
+    assert stmt['p95_ms'] == 100
+    assert stmt['max_ms'] == 100
+
+
+def test_slow_query_log_caps_fingerprints():
+    log = query_metrics.SlowQueryLog(threshold_ms=0, max_fingerprints=1)
+    log.record("SELECT a FROM t", 1)
+    log.record("SELECT b FROM t", 1)
+    snapshot = log.snapshot()
+    assert len(snapshot['statements']) == 1
+    assert snapshot['dropped_fingerprints'] == 1
+
+
+@pytest.fixture
+def admin_client(monkeypatch):
+    from routes.admin.query_stats import admin_query_stats_bp
+
+    monkeypatch.setattr('auth.token_validator.verify_token',
+                        lambda token, expected_use=None: {'sub': 'admin-1', 'cognito:groups': ['admin']})
+    log = query_metrics.SlowQueryLog(threshold_ms=0)
+    monkeypatch.setattr('routes.admin.query_stats.slow_query_log', log)
+    app = Flask(__name__)
+    app.register_blueprint(admin_query_stats_bp)
+    return app.test_client(), log
+
+
+def test_query_stats_endpoint_returns_aggregates(admin_client):
+    client, log = admin_client
+    log.record("SELECT * FROM products WHERE id = 1", 12.5)
+    response = client.get('/admin/query-stats', headers={'Authorization': 'Bearer token'})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['success'] is True
+    assert data['statements'][0]['fingerprint'] == "select * from products where id = ?"
+
+
+def test_query_stats_endpoint_requires_token(admin_client):
+    client, _ = admin_client
+    assert client.get('/admin/query-stats').status_code == 401
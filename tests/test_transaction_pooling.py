@@ -0,0 +1,225 @@
+"""
+Cart and checkout flows through a PgBouncer stand-in in transaction mode.
+
+The stand-in hands each client transaction to the next server session in
+turn (there are enough of them that no transaction in these flows reuses the
+session of an earlier one) and records any session-level state a client
+leaves behind: a SET that isn't SET LOCAL, and PREPARE.
+"""
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+from psycopg2 import errors, extensions
+
+import db
+import prepared_statements
+from cart_routes import cart_bp
+from checkout_routes import checkout_bp
+
+
+class ServerSession:
+    def __init__(self, number):
+        self.number = number
+        self.prepared = set()
+
+
+class Bouncer:
+    """Transaction-mode pooler: a server session is held only for one transaction."""
+
+    def __init__(self, responder, servers=16):
+        self.responder = responder
+        self.servers = [ServerSession(i) for i in range(servers)]
+        self._next = 0
+        self.transactions = []   # statements per client transaction
+        self.session_state = []  # statements that would leak into a server session
+
+    def connect(self, connection_factory=None, **kwargs):
+        return ClientConnection(self)
+
+    def assign(self):
+        server = self.servers[self._next % len(self.servers)]
+        self._next += 1
+        self.transactions.append([])
+        return server
+
+
+class FakeInfo:
+    def __init__(self):
+        self.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+
+class ClientConnection:
+    timeouts = None
+    local_timeouts = None
+    prepared_statements = None
+    stale_statements = None
+
+    def __init__(self, bouncer):
+        self.bouncer = bouncer
+        self.server = None
+        self.autocommit = False
+        self.closed = 0
+        self.info = FakeInfo()
+
+    def cursor(self, cursor_factory=None):
+        return ClientCursor(self)
+
+    def _end(self):
+        self.server = None
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        self._end()
+
+    def rollback(self):
+        self._end()
+
+    def close(self):
+        self.closed = 1
+
+
+class ClientCursor:
+    def __init__(self, conn):
+        self.connection = conn
+        self._rows = []
+
+    def execute(self, query, params=None):
+        conn = self.connection
+        bouncer = conn.bouncer
+        if conn.server is None:
+            conn.server = bouncer.assign()
+            if not conn.autocommit:
+                conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+        bouncer.transactions[-1].append(query)
+
+        sql = ' '.join(query.split())
+        if sql.startswith(('PREPARE', 'DEALLOCATE')) or (
+                'set_config' in sql and ', false)' in sql) or sql.startswith('SET ') and 'LOCAL' not in sql:
+            bouncer.session_state.append(sql)
+        if sql.startswith('PREPARE'):
+            conn.server.prepared.add(sql.split()[1])
+        if sql.startswith('EXECUTE'):
+            name = sql.split()[1]
+            if name not in conn.server.prepared:
+                raise errors.InvalidSqlStatementName(f'prepared statement "{name}" does not exist')
+            sql = ' '.join(prepared_statements.registered()[name].split())
+
+        self._rows = [] if sql.startswith('PREPARE') else list(bouncer.responder(sql, params) or [])
+        if conn.autocommit:
+            conn.server = None
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+class Store:
+    """Just enough of the cart/checkout schema to answer the routes' queries."""
+
+    def __init__(self):
+        self.carts = {}  # user_id -> {product_id: quantity}
+        self.products = {5: ('Hex Tile', 'HT-5', 12.5)}
+
+    def __call__(self, sql, params):
+        if sql.startswith('SELECT 1') or 'set_config' in sql:
+            return [(1,)]
+        if sql.startswith('SELECT id FROM cart WHERE user_id'):
+            return [(params[0],)] if params[0] in self.carts else []
+        if sql.startswith('INSERT INTO cart (user_id)'):
+            self.carts[params[0]] = {}
+            return [(params[0],)]
+        if sql.startswith('SELECT id, quantity FROM cart_items'):
+            quantity = self.carts[params[0]].get(params[1])
+            return [(params[1], quantity)] if quantity else []
+        if sql.startswith('INSERT INTO cart_items'):
+            self.carts[params[0]][params[1]] = params[2]
+            return []
+        if 'SELECT ci.id AS cart_item_id' in sql:
+            return [
+                (pid, pid, self.products[pid][0], self.products[pid][1], qty, self.products[pid][2])
+                for pid, qty in self.carts.get(params[0], {}).items()
+            ]
+        if 'SELECT ci.product_id, ci.quantity' in sql:
+            return [
+                {'product_id': pid, 'quantity': qty, 'price': self.products[pid][2], 'name': self.products[pid][0]}
+                for pid, qty in self.carts.get(params[0], {}).items()
+            ]
+        if sql.startswith('INSERT INTO') and 'RETURNING id' in sql:
+            return [{'id': 1}]
+        if sql.startswith('SELECT name FROM provinces'):
+            return [{'name': 'Punjab'}]
+        if sql.startswith('DELETE FROM cart WHERE user_id'):
+            self.carts.pop(params[0], None)
+        return []
+
+
+@pytest.fixture
+def bouncer(monkeypatch):
+    bouncer = Bouncer(Store())
+    monkeypatch.setattr(db.psycopg2, 'connect', bouncer.connect)
+    monkeypatch.setattr(db, 'PoolConnection', ClientConnection)
+    monkeypatch.setattr(db, '_pools', {})
+    monkeypatch.delenv('DB_REPLICA_DSN', raising=False)
+    monkeypatch.setenv('DB_POOL_MIN', '0')
+    monkeypatch.setenv('DB_POOL_MAX', '1')
+    return bouncer
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'test-secret-key'
+    db.init_app(app)
+    app.register_blueprint(cart_bp)
+    app.register_blueprint(checkout_bp)
+    return app.test_client()
+
+
+def run_cart_and_checkout(client):
+    headers = {'X-Guest-ID': 'guest-1'}
+    assert client.post('/cart/add', json={'product_id': 5, 'quantity': 10}, headers=headers).status_code == 201
+    cart = client.get('/cart', headers=headers).get_json()
+    assert cart['items'][0]['product_code'] == 'HT-5'
+
+    with client.session_transaction() as session:
+        session['guest_id'] = 'guest-1'
+    with patch('checkout_routes.send_order_confirmation_email', return_value=True), \
+            patch('checkout_routes.send_admin_order_notification', return_value=True):
+        response = client.post('/checkout', json={
+            'customer_info': {'name': 'Ayesha', 'email': 'ayesha@example.com', 'phone': '0300'},
+            'shipping_address': {'province_id': 1, 'city': 'Lahore', 'street_address': '1 Mall Rd'},
+        })
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['total'] == 125.0
+
+
+def test_cart_and_checkout_leave_no_session_state(bouncer, client, monkeypatch):
+    monkeypatch.setenv('DB_TRANSACTION_POOLING', 'true')
+    run_cart_and_checkout(client)
+
+    assert bouncer.session_state == []
+    transactions = [t for t in bouncer.transactions if t != ['SELECT 1']]
+    assert len(transactions) == 3  # add to cart, view cart, checkout
+    for statements in transactions:
+        # Every transaction starts by scoping the route's timeouts to itself
+        assert 'set_config' in statements[0] and ', true)' in statements[0]
+
+    # A repeat visit lands on another server session and still works
+    assert client.get('/cart', headers={'X-Guest-ID': 'guest-1'}).status_code == 200
+
+
+def test_session_mode_breaks_behind_the_pooler(bouncer, client, monkeypatch):
+    monkeypatch.setenv('DB_TRANSACTION_POOLING', 'false')
+    run_cart_and_checkout(client)
+    assert any(s.startswith('PREPARE') for s in bouncer.session_state)
+    assert any(', false)' in s for s in bouncer.session_state)
+
+    # The statement was PREPAREd on a session this transaction doesn't own
+    assert client.get('/cart', headers={'X-Guest-ID': 'guest-1'}).status_code == 500